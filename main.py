@@ -11,7 +11,14 @@ import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
 from datetime import datetime
+from functools import lru_cache
+import hashlib
 import io
+import os
+
+# Figuras sem o template padrão do plotly: as cores usadas são explícitas e o tema
+# visual vem do st.plotly_chart, então o template só aumentava o JSON de cada gráfico
+pio.templates.default = 'none'
 
 # ============================================================================
 # CONFIGURAÇÃO DA PÁGINA
@@ -24,141 +31,164 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# CSS Customizado
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: bold;
-        color: #1f77b4;
-        text-align: center;
-        padding: 1rem;
-        background: linear-gradient(90deg, #e8f4f8 0%, #ffffff 100%);
-        border-radius: 10px;
-        margin-bottom: 2rem;
-    }
-    .metric-card {
-        background-color: #f0f2f6;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #1f77b4;
-    }
-    .error-card {
-        background-color: #ffe6e6;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #ff4444;
-    }
-    .success-card {
-        background-color: #e6ffe6;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #44ff44;
-    }
-    .info-card {
-        background-color: #e6f3ff;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #4488ff;
-    }
-</style>
-""", unsafe_allow_html=True)
+# CSS Customizado: static/styles.css lido uma única vez por processo e injetado como <style>
+# (um <link> para /app/static depende do content-type servido pela versão do Streamlit)
+@st.cache_resource
+def _css_customizado():
+    """Bloco <style> com o conteúdo de static/styles.css"""
+    caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'styles.css')
+    with open(caminho, encoding='utf-8') as f:
+        return f"<style>{f.read()}</style>"
+
+st.markdown(_css_customizado(), unsafe_allow_html=True)
 
 # ============================================================================
 # BASE DE CONHECIMENTO (Cópia das células 2 e 3)
 # ============================================================================
 
 
-@st.cache_data
-def carregar_base_conhecimento():
-    """Carrega códigos e regras de negócio"""
-    codigos_data = {
-        'CODIGO': [11100, 11200, 16000, 15000, 14000, 13000, 12000, 21000, 22000,
-                   23000, 24100, 24200, 31100, 31200, 31300, 31000, 32000, 33000, 34000],
-        'DESCRICAO': ['Aposentadoria Normal', 'Aposentadoria por Invalidez',
-                      'Outros Benefícios de Prestação Única',
-                      'Pecúlio (Pagamento a Herdeiros)', 'Pensão por Morte',
-                      'Auxílio Único (Natalidade/Funeral)', 'Auxílio Continuado (Afastamento Doença)',
-                      'BPD (Benefício Proporcional Diferido)',
-                      'Autopatrocinado', 'Resgate Total',
-                      'Portabilidade Saída', 'Portabilidade Entrada',
-                      'Ativo com Contrib. Empresa', 'Ativo com Contrib. Empresa + Participante',
-                      'Ativo Contrib. Só Participante',
-                      'Consolidado Ativos', 'Consolidado Aposentados',
-                      'Consolidado Pensionistas', 'Designados (Dependentes)'],
-        'TIPO': ['Benefício', 'Benefício', 'Benefício', 'Benefício', 'Benefício',
-                 'Benefício', 'Benefício', 'Instituto', 'Instituto', 'Instituto',
-                 'Instituto', 'Instituto', 'População', 'População', 'População',
-                 'Consolidador', 'Consolidador', 'Consolidador', 'População']
-    }
-    df_codigos = pd.DataFrame(codigos_data)
-
-    # CÓDIGOS CONSOLIDADORES QUE DEVEM SER IGNORADOS NA ANÁLISE
-    CODIGOS_IGNORAR = set()  # Não ignorar mais códigos consolidadores
-
-    # CÓDIGOS QUE CAUSAM RUÍDO EM MÚLTIPLAS SAÍDAS (devem ser filtrados ao calcular saídas líquidas)
-    CODIGOS_RUIDO_SAIDA = {31100, 31200, 31300, 31000, 32000, 33000, 11000, 14000}
-
-    CONTAS_ZERAGEM_ANUAL = {13000, 15000, 16000, 23000, 24100, 24200}
-    CODIGOS_ADMISSAO = {31100, 31200}
-    CODIGOS_ATIVOS = {31100, 31200, 31300}
-    CODIGOS_SEM_RETORNO = {21000}
-    CODIGOS_DESLIGAMENTO_RUIDO = {21000, 22000, 31300}
-
-    CODIGOS_ENTRADA_INDEPENDENTE = {13000, 24100, 24200}
-
-    regras_validas = [
-        (31100, 11100), (31200, 11100), (31300,
-                                         11100), (21000, 11100), (22000, 11100),
-        (31100, 11200), (31200, 11200), (31300, 11200), (12000,
-                                                         11200), (21000, 11200), (22000, 11200),
-        (31100, 12000), (31200, 12000), (31300, 12000), (22000, 12000),
-        (31100, 13000), (31200, 13000), (31300,
-                                         13000), (11100, 13000), (11200, 13000),
-        (31100, 14000), (31200, 14000), (31300, 14000), (11100,
-                                                         14000), (11200, 14000), (22000, 14000),
-        (31100, 15000), (31200, 15000), (31300,
-                                         15000), (11100, 15000), (11200, 15000),
-        (14000, 15000), (21000, 15000), (22000, 15000),
-        (31100, 16000), (31200, 16000), (31300,
-                                         16000), (11100, 16000), (11200, 16000),
-        (21000, 16000), (22000, 16000),
-        (31100, 21000), (31200, 21000), (31300, 21000), (22000, 21000),
-        (31100, 22000), (31200, 22000), (31300, 22000),
-        (31100, 23000), (31200, 23000), (31300,
-                                         23000), (21000, 23000), (22000, 23000),
-        (31100, 24100), (31200, 24100), (31300,
-                                         24100), (21000, 24100), (22000, 24100),
-        (31100, 24200), (31200, 24200), (31300,
-                                         24200), (21000, 24200), (22000, 24200),
-        (11100, 24200), (11200, 24200),
-        (31200, 31100), (12000, 31100), (22000, 31100),
-        (31100, 31200), (12000, 31200), (22000, 31200),
-        (31100, 31300), (31200, 31300), (21000, 31300), (22000, 31300)
-    ]
+_CODIGO = np.array([11100, 11200, 16000, 15000, 14000, 13000, 12000, 21000, 22000,
+                    23000, 24100, 24200, 31100, 31200, 31300, 31000, 32000, 33000, 34000],
+                   dtype=np.int32)
+_DESCRICAO = ('Aposentadoria Normal', 'Aposentadoria por Invalidez',
+              'Outros Benefícios de Prestação Única',
+              'Pecúlio (Pagamento a Herdeiros)', 'Pensão por Morte',
+              'Auxílio Único (Natalidade/Funeral)', 'Auxílio Continuado (Afastamento Doença)',
+              'BPD (Benefício Proporcional Diferido)',
+              'Autopatrocinado', 'Resgate Total',
+              'Portabilidade Saída', 'Portabilidade Entrada',
+              'Ativo com Contrib. Empresa', 'Ativo com Contrib. Empresa + Participante',
+              'Ativo Contrib. Só Participante',
+              'Consolidado Ativos', 'Consolidado Aposentados',
+              'Consolidado Pensionistas', 'Designados (Dependentes)')
+_TIPO = ('Benefício', 'Benefício', 'Benefício', 'Benefício', 'Benefício',
+         'Benefício', 'Benefício', 'Instituto', 'Instituto', 'Instituto',
+         'Instituto', 'Instituto', 'População', 'População', 'População',
+         'Consolidador', 'Consolidador', 'Consolidador', 'População')
+# Colunas já tipadas: sem inferência de dtype nem coluna object
+_CODIGOS_DF = pd.DataFrame({
+    'CODIGO': _CODIGO,
+    'DESCRICAO': pd.array(_DESCRICAO, dtype='str'),
+    'TIPO': pd.Categorical(_TIPO)
+}, copy=False)
+
+# CÓDIGOS CONSOLIDADORES QUE DEVEM SER IGNORADOS NA ANÁLISE
+CODIGOS_IGNORAR = frozenset()  # Não ignorar mais códigos consolidadores
+
+# CÓDIGOS QUE CAUSAM RUÍDO EM MÚLTIPLAS SAÍDAS (devem ser filtrados ao calcular saídas líquidas)
+CODIGOS_RUIDO_SAIDA = frozenset({31100, 31200, 31300, 31000, 32000, 33000, 11000, 14000})
+
+CONTAS_ZERAGEM_ANUAL = frozenset({13000, 15000, 16000, 23000, 24100, 24200})
+CODIGOS_ADMISSAO = frozenset({31100, 31200})
+CODIGOS_ATIVOS = frozenset({31100, 31200, 31300})
+# Mesma lista como array ordenado, para np.isin sem conversão de conjunto a cada análise
+_CODIGOS_ATIVOS_ARR = np.array(sorted(CODIGOS_ATIVOS), dtype=np.int32)
+CODIGOS_SEM_RETORNO = frozenset({21000})
+CODIGOS_DESLIGAMENTO_RUIDO = frozenset({21000, 22000, 31300})
+
+CODIGOS_ENTRADA_INDEPENDENTE = frozenset({13000, 24100, 24200})
+# Entradas independentes mais 34000 (Designados), como array ordenado para a classificação vetorizada
+_CODIGOS_INDEPENDENTES_ARR = np.array(sorted(CODIGOS_ENTRADA_INDEPENDENTE | {34000}), dtype=np.int32)
+
+# Transições válidas (origem, destino) num único buffer int32 contíguo
+_REGRAS_ARR = np.array([
+    [31100, 11100], [31200, 11100], [31300, 11100], [21000, 11100], [22000, 11100],
+    [31100, 11200], [31200, 11200], [31300, 11200], [12000, 11200], [21000, 11200], [22000, 11200],
+    [31100, 12000], [31200, 12000], [31300, 12000], [22000, 12000],
+    [31100, 13000], [31200, 13000], [31300, 13000], [11100, 13000], [11200, 13000],
+    [31100, 14000], [31200, 14000], [31300, 14000], [11100, 14000], [11200, 14000], [22000, 14000],
+    [31100, 15000], [31200, 15000], [31300, 15000], [11100, 15000], [11200, 15000], [14000, 15000],
+    [21000, 15000], [22000, 15000],
+    [31100, 16000], [31200, 16000], [31300, 16000], [11100, 16000], [11200, 16000], [21000, 16000],
+    [22000, 16000],
+    [31100, 21000], [31200, 21000], [31300, 21000], [22000, 21000],
+    [31100, 22000], [31200, 22000], [31300, 22000],
+    [31100, 23000], [31200, 23000], [31300, 23000], [21000, 23000], [22000, 23000],
+    [31100, 24100], [31200, 24100], [31300, 24100], [21000, 24100], [22000, 24100],
+    [31100, 24200], [31200, 24200], [31300, 24200], [21000, 24200], [22000, 24200], [11100, 24200],
+    [11200, 24200],
+    [31200, 31100], [12000, 31100], [22000, 31100],
+    [31100, 31200], [12000, 31200], [22000, 31200],
+    [31100, 31300], [31200, 31300], [21000, 31300], [22000, 31300]
+], dtype=np.int32)
+
+# Cada par (origem, destino) é empacotado num único inteiro: (origem << 32) | destino
+_REGRAS_VALIDAS = frozenset(
+    ((_REGRAS_ARR[:, 0].astype(np.int64) << 32) | _REGRAS_ARR[:, 1]).tolist())
+
+# Categorias fixas das colunas de resultado; a ordem de GRAVIDADE é a de severidade
+GRAVIDADE_DTYPE = pd.CategoricalDtype(['OK', 'INFO', 'ERRO'], ordered=True)
+TIPO_PASSO_DTYPE = pd.CategoricalDtype(
+    ['Indefinido', '0. Independente', '1. Início', '2. Intermediário', '3. Fim'], ordered=True)
+
+_CONSTANTES = {
+    'CODIGOS_IGNORAR': CODIGOS_IGNORAR,
+    'CODIGOS_ATIVOS': CODIGOS_ATIVOS,
+    'CODIGOS_ATIVOS_ARR': _CODIGOS_ATIVOS_ARR,
+    'CODIGOS_ADMISSAO': CODIGOS_ADMISSAO,
+    'CODIGOS_DESLIGAMENTO_RUIDO': CODIGOS_DESLIGAMENTO_RUIDO,
+    'CODIGOS_RUIDO_SAIDA': CODIGOS_RUIDO_SAIDA,
+    'CODIGOS_ENTRADA_INDEPENDENTE': CODIGOS_ENTRADA_INDEPENDENTE,
+    'CODIGOS_INDEPENDENTES_ARR': _CODIGOS_INDEPENDENTES_ARR,
+    'DESC_MAP': dict(zip(_CODIGO.tolist(), _DESCRICAO))
+}
 
-    return df_codigos, set(regras_validas), {
-        'CODIGOS_IGNORAR': CODIGOS_IGNORAR,
-        'CODIGOS_ATIVOS': CODIGOS_ATIVOS,
-        'CODIGOS_ADMISSAO': CODIGOS_ADMISSAO,
-        'CODIGOS_DESLIGAMENTO_RUIDO': CODIGOS_DESLIGAMENTO_RUIDO,
-        'CODIGOS_RUIDO_SAIDA': CODIGOS_RUIDO_SAIDA,
-        'CODIGOS_ENTRADA_INDEPENDENTE': CODIGOS_ENTRADA_INDEPENDENTE
-    }
+
+def carregar_base_conhecimento():
+    """Retorna códigos e regras de negócio (constantes do módulo)"""
+    return _CODIGOS_DF, _REGRAS_VALIDAS, _CONSTANTES
 
 
 def get_descricao(codigo, df_codigos_ref):
     """Retorna descrição do código"""
+    # Base padrão: consulta direta no dicionário pré-montado
+    if df_codigos_ref is _CODIGOS_DF:
+        return _CONSTANTES['DESC_MAP'].get(codigo, f'Código Desconhecido ({codigo})')
     res = df_codigos_ref[df_codigos_ref['CODIGO'] == codigo]['DESCRICAO']
     return res.iloc[0] if not res.empty else f'Código Desconhecido ({codigo})'
 
 
+@lru_cache(maxsize=512)
+def _msg_transicao_valida(cod_origem, cod_destino):
+    """Mensagem de transição válida, formatada uma vez por par de códigos"""
+    desc_map = _CONSTANTES['DESC_MAP']
+    return f"OK: Transição válida {desc_map.get(cod_origem, f'Código Desconhecido ({cod_origem})')} → {desc_map.get(cod_destino, f'Código Desconhecido ({cod_destino})')}"
+
+
+@lru_cache(maxsize=512)
+def _msg_transicao_nao_permitida(cod_origem, cod_destino):
+    """Mensagem de transição não permitida, formatada uma vez por par de códigos"""
+    return f"ERRO: Transição NÃO PERMITIDA {cod_origem} → {cod_destino}"
+
+
 def formatar_nome_participante(nome):
-    """Formata nome do participante"""
+    """Formata nome do participante (valor único; para colunas use formatar_nomes)"""
     if pd.isna(nome):
         return "Nome não informado"
     return str(nome).strip().title()
 
+
+def formatar_nomes(nomes):
+    """Formata uma coluna de nomes de uma vez (versão vetorizada de formatar_nome_participante)"""
+    # Cada nome distinto é formatado uma única vez; ausentes (-1) caem no último item
+    codigos, unicos = pd.factorize(nomes)
+    formatados = pd.Series(unicos).astype(str).str.strip().str.title().to_numpy(dtype=object)
+    formatados = np.append(formatados, "Nome não informado")
+    return pd.Series(formatados[codigos], index=nomes.index)
+
+
+def otimizar_tipos(df):
+    """Converte as colunas usadas na análise para tipos compactos (Arrow, categoria, inteiros)"""
+    tipos = {
+        'CODIGO ORGANIZACAO NOME': 'string[pyarrow]',
+        'MOVIMENTO': 'category',
+        'CODIGO BENEFICIO': 'int32',
+        'ANO MES': 'int32'
+    }
+    if 'PLANO' in df.columns and pd.api.types.is_integer_dtype(df['PLANO']):
+        tipos['PLANO'] = 'int16'
+    return df.astype({col: tipo for col, tipo in tipos.items() if col in df.columns})
+
 # ============================================================================
 # MOTOR DE ANÁLISE (Cópia da célula 4 - simplificada)
 # ============================================================================
@@ -170,312 +200,419 @@ def analisar_movimentacoes_mes(df_mov, df_codigos, regras_validas, constantes, m
     if mes_analise is None:
         mes_analise = df_mov['ANO MES'].max()
 
-    df_mes = df_mov[df_mov['ANO MES'] == mes_analise].copy()
+    # Comparação direta no array NumPy (sem indexador booleano do pandas)
+    df_mes = df_mov.loc[df_mov['ANO MES'].to_numpy() == mes_analise].copy()
 
     if df_mes.empty:
         return df_mes
 
-    df_mes['ANALISE'] = 'OK'
-    df_mes['TIPO_PASSO'] = 'Indefinido'
-    df_mes['INTERPRETACAO'] = ''
-    df_mes['GRAVIDADE'] = 'OK'
+    return _analisar_mes_recortado(df_mes, df_codigos, regras_validas, constantes)
 
-    grouped = df_mes.groupby('CODIGO ORGANIZACAO NOME')
 
-    stats = {'total': len(grouped), 'erros': 0, 'info': 0, 'ok': 0}
+def _analisar_mes_recortado(df_mes, df_codigos, regras_validas, constantes):
+    """Núcleo da análise sobre as linhas de um único mês (df_mes é uma cópia própria e é alterado)"""
 
-    for nome_participante, group in grouped:
+    # Tipos compactos para as colunas percorridas pela análise
+    df_mes['CODIGO BENEFICIO'] = df_mes['CODIGO BENEFICIO'].astype('int32')
+    df_mes['MOVIMENTO'] = df_mes['MOVIMENTO'].astype('category')
 
-        # Validação 1: Múltiplas situações ativas
-        if 'PLANO' in group.columns:
-            for plano in group['PLANO'].unique():
-                group_plano = group[group['PLANO'] == plano]
-                entradas_plano = group_plano[group_plano['MOVIMENTO'] == 'ENTRADA']
-                codigos_ativos_entrada = set(
-                    entradas_plano['CODIGO BENEFICIO']) & constantes['CODIGOS_ATIVOS']
+    df_mes['ANALISE'] = 'OK'
+    df_mes['TIPO_PASSO'] = pd.Categorical.from_codes(np.zeros(len(df_mes), dtype=np.int8), dtype=TIPO_PASSO_DTYPE)
+    df_mes['INTERPRETACAO'] = ''
+    df_mes['GRAVIDADE'] = pd.Categorical.from_codes(np.zeros(len(df_mes), dtype=np.int8), dtype=GRAVIDADE_DTYPE)
+
+    # Chave inteira por participante (ordem de primeira aparição, sem ordenar nomes)
+    df_mes['_pid'], participantes = pd.factorize(df_mes['CODIGO ORGANIZACAO NOME'].values, sort=False)
+    n_grupos = len(participantes)
+
+    # Estado por participante usado na classificação vetorizada de TIPO_PASSO
+    grupo_classificado = np.zeros(n_grupos, dtype=bool)
+    grupo_saida_aposentadoria = np.zeros(n_grupos, dtype=bool)
+    grupo_saida_pensao = np.zeros(n_grupos, dtype=bool)
+    grupo_saida_autopatrocinado = np.zeros(n_grupos, dtype=bool)
+    chaves_saidas_liquidas = []
+
+    # Arrays brutos das colunas usadas no loop; MOVIMENTO comparado uma única vez (códigos da categoria)
+    cod_linha = df_mes['CODIGO BENEFICIO'].to_numpy()
+    is_entrada = (df_mes['MOVIMENTO'] == 'ENTRADA').to_numpy()
+    is_saida = (df_mes['MOVIMENTO'] == 'SAIDA').to_numpy()
+    plano_linha = df_mes['PLANO'].to_numpy() if 'PLANO' in df_mes.columns else None
+
+    # Posições de cada participante como trechos contíguos de uma ordenação estável por _pid
+    # (sem tabela hash do groupby; df_mes mantém a ordem original das linhas)
+    pid_linha = df_mes['_pid'].to_numpy().astype(np.int64)
+    ordem = np.argsort(pid_linha, kind='stable')
+    limites = np.flatnonzero(np.diff(pid_linha[ordem])) + 1
+    posicoes_por_grupo = np.split(ordem, limites)
+
+    # ANALISE/GRAVIDADE acumulados por participante e gravados de uma vez no final
+    registros_pos = []
+    registros_msg = []
+    registros_grav = []
+
+    # Códigos do mês como bits (ordem crescente): cada participante vira uma máscara inteira
+    # de entradas e outra de saídas, e as operações de conjunto viram AND/OR/NOT
+    codigos_mes, indice_linha = np.unique(cod_linha, return_inverse=True)
+    codigos_mes = codigos_mes.tolist()
+    indice_codigo = {codigo: i for i, codigo in enumerate(codigos_mes)}
+
+    def _bits(*codigos):
+        mascara = 0
+        for codigo in codigos:
+            i = indice_codigo.get(codigo)
+            if i is not None:
+                mascara |= 1 << i
+        return mascara
+
+    def _codigos(mascara):
+        # Códigos presentes na máscara, em ordem crescente
+        codigos = []
+        while mascara:
+            bit = mascara & -mascara
+            codigos.append(codigos_mes[bit.bit_length() - 1])
+            mascara ^= bit
+        return codigos
+
+    if len(codigos_mes) <= 64:
+        bit_linha = np.left_shift(np.uint64(1), indice_linha.astype(np.uint64))
+
+        def _mascaras_por_grupo(mask):
+            acumulado = np.zeros(n_grupos, dtype=np.uint64)
+            np.bitwise_or.at(acumulado, pid_linha[mask], bit_linha[mask])
+            return acumulado.tolist()
+    else:
+        def _mascaras_por_grupo(mask):
+            acumulado = [0] * n_grupos
+            for id_grupo, i in zip(pid_linha[mask].tolist(), indice_linha[mask].tolist()):
+                acumulado[id_grupo] |= 1 << i
+            return acumulado
+
+    entradas_por_grupo = _mascaras_por_grupo(is_entrada)
+    saidas_por_grupo = _mascaras_por_grupo(is_saida)
+
+    # Conjuntos de constantes consultados por grupo, resolvidos uma vez fora do loop
+    codigos_independentes = constantes.get('CODIGOS_ENTRADA_INDEPENDENTE', set())
+    codigos_ruido_saida = constantes['CODIGOS_RUIDO_SAIDA']
+    codigos_admissao = constantes['CODIGOS_ADMISSAO']
+
+    # Máscaras dos códigos e grupos de códigos consultados no loop (0 se o código não ocorre no mês)
+    B_11100, B_14000, B_15000, B_21000 = _bits(11100), _bits(14000), _bits(15000), _bits(21000)
+    B_22000, B_23000, B_31200, B_31300 = _bits(22000), _bits(23000), _bits(31200), _bits(31300)
+    B_32000, B_33000, B_34000 = _bits(32000), _bits(33000), _bits(34000)
+    M_APOSENTADORIA = _bits(11100, 11200)
+    M_ORIGEM_RESGATE = _bits(31200, 21000, 22000)
+    M_APOSENTADOS = _bits(11000, 11100, 11200)
+    M_INSTITUTO = _bits(21000, 22000)
+    M_INDEPENDENTES = _bits(*codigos_independentes, 34000)
+    M_RUIDO_SAIDA = _bits(*codigos_ruido_saida)
+    M_CONSOLIDADORES = _bits(31000, 32000, 33000)
+    M_ORIGEM_PENSAO = _bits(31100, 31200, 22000, 11100, 11200)
+    # {21000, 31300} só pode ser igualado se os dois códigos ocorrem no mês
+    M_DESTINO_31200_ACEITO = _bits(21000, 31300) if B_21000 and B_31300 else -1
+
+    # Validação 1: Múltiplas situações ativas (participante x plano), em uma única agregação.
+    # Não interrompe as validações seguintes, que podem sobrescrever a mensagem.
+    if plano_linha is not None:
+        mask_ativos = is_entrada & np.isin(cod_linha, constantes['CODIGOS_ATIVOS_ARR'])
+        entradas_ativas = pd.DataFrame({
+            '_pid': pid_linha[mask_ativos],
+            'PLANO': plano_linha[mask_ativos],
+            'CODIGO BENEFICIO': cod_linha[mask_ativos],
+        })
+        n_ativos = entradas_ativas.groupby(['_pid', 'PLANO'], sort=False)['CODIGO BENEFICIO'].nunique()
+        for id_grupo, plano in n_ativos.index[n_ativos.to_numpy() > 1]:
+            posicoes_grupo = posicoes_por_grupo[id_grupo]
+            msg = f"ERRO: Múltiplas situações ativas no Plano {plano}"
+            registros_pos.append(posicoes_grupo[plano_linha[posicoes_grupo] == plano])
+            registros_msg.append(msg)
+            registros_grav.append('ERRO')
 
-                if len(codigos_ativos_entrada) > 1:
-                    msg = f"ERRO: Múltiplas situações ativas no Plano {plano}"
-                    df_mes.loc[group_plano.index, 'ANALISE'] = msg
-                    df_mes.loc[group_plano.index, 'GRAVIDADE'] = 'ERRO'
-                    stats['erros'] += 1
-                    continue
+    for id_grupo, posicoes_grupo in enumerate(posicoes_por_grupo):
 
         # Validação 2: Pensão vs Pecúlio
-        entradas = group[group['MOVIMENTO'] == 'ENTRADA']
-        codigos_entrada_set = set(entradas['CODIGO BENEFICIO'])
+        entrada = entradas_por_grupo[id_grupo]
 
         # Análise de transições
-        saidas = group[group['MOVIMENTO'] == 'SAIDA']
-        codigos_saida_set = set(saidas['CODIGO BENEFICIO'])
+        saida = saidas_por_grupo[id_grupo]
+
+        # Sem entradas nem saídas nenhuma regra se aplica: só marca o participante como classificado
+        if not entrada and not saida:
+            grupo_classificado[id_grupo] = True
+            continue
 
         # Validação: Resgate (23000) exige saída de ativo/BPD no mesmo mês
-        if 23000 in codigos_entrada_set and not (codigos_saida_set & {31200, 21000, 22000}):
+        if entrada & B_23000 and not (saida & M_ORIGEM_RESGATE):
             msg = "ERRO: Resgate (23000) sem saída correspondente de ativo (31200) ou BPD (21000/22000)"
-            df_mes.loc[group.index, 'ANALISE'] = msg
-            df_mes.loc[group.index, 'GRAVIDADE'] = 'ERRO'
-            stats['erros'] += 1
+            registros_pos.append(posicoes_grupo)
+            registros_msg.append(msg)
+            registros_grav.append('ERRO')
             continue
 
         # Validação 1.5: Código 14000 (Pensão) isolado sem 33000
-        if 14000 in codigos_entrada_set or 14000 in codigos_saida_set:
-            if 14000 in codigos_saida_set and 33000 not in codigos_saida_set:
+        if (entrada | saida) & B_14000:
+            if saida & B_14000 and not (saida & B_33000):
                 msg = "INFO: Saída no código 14000 (Pensão por Morte) sem saída correspondente na conta 33000 no mesmo mês - verificar meses adjacentes"
-                df_mes.loc[group.index, 'ANALISE'] = msg
-                df_mes.loc[group.index, 'GRAVIDADE'] = 'INFO'
-                stats['info'] += 1
+                registros_pos.append(posicoes_grupo)
+                registros_msg.append(msg)
+                registros_grav.append('INFO')
                 continue
-            if 14000 in codigos_entrada_set and 33000 not in codigos_entrada_set:
+            if entrada & B_14000 and not (entrada & B_33000):
                 msg = "INFO: Entrada no código 14000 (Pensão por Morte) sem entrada correspondente na conta 33000 no mesmo mês - verificar meses adjacentes"
-                df_mes.loc[group.index, 'ANALISE'] = msg
-                df_mes.loc[group.index, 'GRAVIDADE'] = 'INFO'
-                stats['info'] += 1
+                registros_pos.append(posicoes_grupo)
+                registros_msg.append(msg)
+                registros_grav.append('INFO')
                 continue
 
-        if 14000 in codigos_entrada_set and 15000 in codigos_entrada_set:
+        if entrada & B_14000 and entrada & B_15000:
             msg = "ERRO: PENSÃO e PECÚLIO no mesmo mês"
-            df_mes.loc[group.index, 'ANALISE'] = msg
-            df_mes.loc[group.index, 'GRAVIDADE'] = 'ERRO'
-            stats['erros'] += 1
+            registros_pos.append(posicoes_grupo)
+            registros_msg.append(msg)
+            registros_grav.append('ERRO')
             continue
 
         # Validação 3: Códigos consolidadores devem ter movimentações correspondentes
-        if 'CODIGO BENEFICIO' in entradas.columns:
+        if 'CODIGO BENEFICIO' in df_mes.columns:
             # Valida código 32000 (Consolidado Aposentados)
-            if 32000 in codigos_entrada_set or 32000 in codigos_saida_set:
+            if (entrada | saida) & B_32000:
                 # 32000 deve refletir movimentações em 11000, 11100, 11200
-                codigos_aposentados = {11000, 11100, 11200}
-                movs_aposentados = codigos_entrada_set.union(codigos_saida_set) & codigos_aposentados
-                
-                if not movs_aposentados:
+                if not ((entrada | saida) & M_APOSENTADOS):
                     msg = "ERRO: Código 32000 lançado sem movimentação correspondente nas contas de aposentados (11000, 11100, 11200)"
-                    df_mes.loc[group.index, 'ANALISE'] = msg
-                    df_mes.loc[group.index, 'GRAVIDADE'] = 'ERRO'
-                    stats['erros'] += 1
+                    registros_pos.append(posicoes_grupo)
+                    registros_msg.append(msg)
+                    registros_grav.append('ERRO')
                     continue
 
             # Valida código 31300 (Consolidado Ativos - Só Participante)
-            if 31300 in codigos_entrada_set or 31300 in codigos_saida_set:
+            if (entrada | saida) & B_31300:
                 # 31300 deve refletir movimentações em 21000, 22000
-                codigos_instituto = {21000, 22000}
-                movs_instituto = codigos_entrada_set.union(codigos_saida_set) & codigos_instituto
-                
-                if not movs_instituto:
+                if not ((entrada | saida) & M_INSTITUTO):
                     msg = "INFO: Código 31300 sem movimentação de instituto correspondente no mesmo mês - verificar meses adjacentes"
-                    df_mes.loc[group.index, 'ANALISE'] = msg
-                    df_mes.loc[group.index, 'GRAVIDADE'] = 'INFO'
-                    stats['info'] += 1
+                    registros_pos.append(posicoes_grupo)
+                    registros_msg.append(msg)
+                    registros_grav.append('INFO')
                     continue
-            
 
         # Validação 4: Código 33000 deve sempre acompanhar 14000
-        if 33000 in codigos_entrada_set or 33000 in codigos_saida_set:
-            if 33000 in codigos_entrada_set and 14000 not in codigos_entrada_set:
+        if (entrada | saida) & B_33000:
+            if entrada & B_33000 and not (entrada & B_14000):
                 msg = "INFO: Entrada no código 33000 (Consolidado Pensionistas) sem entrada correspondente na conta 14000 no mesmo mês - verificar meses adjacentes"
-                df_mes.loc[group.index, 'ANALISE'] = msg
-                df_mes.loc[group.index, 'GRAVIDADE'] = 'INFO'
-                stats['info'] += 1
+                registros_pos.append(posicoes_grupo)
+                registros_msg.append(msg)
+                registros_grav.append('INFO')
                 continue
-            if 33000 in codigos_saida_set and 14000 not in codigos_saida_set:
+            if saida & B_33000 and not (saida & B_14000):
                 msg = "INFO: Saída no código 33000 (Consolidado Pensionistas) sem saída correspondente na conta 14000 no mesmo mês - verificar meses adjacentes"
-                df_mes.loc[group.index, 'ANALISE'] = msg
-                df_mes.loc[group.index, 'GRAVIDADE'] = 'INFO'
-                stats['info'] += 1
+                registros_pos.append(posicoes_grupo)
+                registros_msg.append(msg)
+                registros_grav.append('INFO')
                 continue
+            # Aqui todo lado com 33000 também tem 14000: a antiga checagem de 33000 sem
+            # nenhuma movimentação em 14000 nunca disparava e foi removida
 
-            
-            # Valida código 33000 (Consolidado Pensionistas)
-            if 33000 in codigos_entrada_set or 33000 in codigos_saida_set:
-                # 33000 deve refletir movimentações em 14000
-                if 14000 not in codigos_entrada_set and 14000 not in codigos_saida_set:
-                    msg = "ERRO: Código 33000 lançado sem movimentação correspondente na conta de pensão (14000)"
-                    df_mes.loc[group.index, 'ANALISE'] = msg
-                    df_mes.loc[group.index, 'GRAVIDADE'] = 'ERRO'
-                    stats['erros'] += 1
-                    continue
-
-        codigos_entrada_independentes = codigos_entrada_set & constantes.get(
-            'CODIGOS_ENTRADA_INDEPENDENTE', set())
         # 34000 (Designados/Dependentes) também é independente
-        codigos_entrada_independentes = codigos_entrada_independentes | (codigos_entrada_set & {34000})
-        codigos_entrada_principal = codigos_entrada_set - codigos_entrada_independentes
-
-        codigos_intermediarios = codigos_saida_set.intersection(
-            codigos_entrada_principal)
+        entrada_independente = entrada & M_INDEPENDENTES
+        entrada_principal = entrada & ~entrada_independente
 
         # Calcula saídas e entradas líquidas
-        saidas_liquidas_brutas = codigos_saida_set - codigos_entrada_principal
-        entradas_liquidas = codigos_entrada_principal - codigos_saida_set
-        entradas_independentes_liquidas = codigos_entrada_independentes
+        saidas_liquidas_brutas = saida & ~entrada_principal
+        entradas_liquidas = entrada_principal & ~saida
 
         # FILTRAR CÓDIGOS DE RUÍDO APENAS SE HOUVER MÚLTIPLAS SAÍDAS
         # Se há apenas 1 saída, ela é legítima (mesmo sendo 31100, 31200, etc)
         # Se há múltiplas saídas, remove os códigos consolidadores que são ruído
-        if len(saidas_liquidas_brutas) > 1:
-            saidas_liquidas = saidas_liquidas_brutas - \
-                constantes['CODIGOS_RUIDO_SAIDA']
+        if saidas_liquidas_brutas.bit_count() > 1:
+            saidas_liquidas = saidas_liquidas_brutas & ~M_RUIDO_SAIDA
         else:
             saidas_liquidas = saidas_liquidas_brutas
 
-        if len(entradas_liquidas) > 1:
-            entradas_liquidas_filtradas = entradas_liquidas - constantes['CODIGOS_RUIDO_SAIDA']
+        if entradas_liquidas.bit_count() > 1:
+            entradas_liquidas_filtradas = entradas_liquidas & ~M_RUIDO_SAIDA
         else:
             entradas_liquidas_filtradas = entradas_liquidas
 
         # Strip de códigos consolidadores companheiros (não devem contar como saída/entrada independente)
-        if 32000 in saidas_liquidas and bool(saidas_liquidas & {11100, 11200}):
-            saidas_liquidas = saidas_liquidas - {32000}
-        if 33000 in saidas_liquidas and 14000 in saidas_liquidas:
-            saidas_liquidas = saidas_liquidas - {33000}
-        if 31300 in saidas_liquidas and 22000 in saidas_liquidas:
-            saidas_liquidas = saidas_liquidas - {31300}
-
-        if 32000 in entradas_liquidas_filtradas and bool(entradas_liquidas_filtradas & {11100, 11200}):
-            entradas_liquidas_filtradas = entradas_liquidas_filtradas - {32000}
-        if 33000 in entradas_liquidas_filtradas and 14000 in entradas_liquidas_filtradas:
-            entradas_liquidas_filtradas = entradas_liquidas_filtradas - {33000}
-        if 31300 in entradas_liquidas_filtradas and 22000 in entradas_liquidas_filtradas:
-            entradas_liquidas_filtradas = entradas_liquidas_filtradas - {31300}
-
-        # Classificação de passos
-        for idx, row in group.iterrows():
-            cod = row['CODIGO BENEFICIO']
-            mov = row['MOVIMENTO']
-
-            if cod in entradas_independentes_liquidas and mov == 'ENTRADA':
-                df_mes.loc[idx, 'TIPO_PASSO'] = '0. Independente'
-            elif cod == 34000:
-                df_mes.loc[idx, 'TIPO_PASSO'] = '0. Independente'
-            elif cod == 32000 and mov == 'SAIDA' and bool(codigos_saida_set & {11100, 11200}):
-                df_mes.loc[idx, 'TIPO_PASSO'] = '3. Fim'
-            elif cod == 33000 and mov == 'SAIDA' and 14000 in codigos_saida_set:
-                df_mes.loc[idx, 'TIPO_PASSO'] = '3. Fim'
-            elif cod == 31300 and mov == 'SAIDA' and 22000 in codigos_saida_set:
-                df_mes.loc[idx, 'TIPO_PASSO'] = '1. Início'
-            elif cod in saidas_liquidas and mov == 'SAIDA':
-                df_mes.loc[idx, 'TIPO_PASSO'] = '1. Início'
-            elif cod in entradas_liquidas and mov == 'ENTRADA':
-                df_mes.loc[idx, 'TIPO_PASSO'] = '3. Fim'
-            elif cod in codigos_intermediarios:
-                df_mes.loc[idx, 'TIPO_PASSO'] = '2. Intermediário'
+        if saidas_liquidas & B_32000 and saidas_liquidas & M_APOSENTADORIA:
+            saidas_liquidas &= ~B_32000
+        if saidas_liquidas & B_33000 and saidas_liquidas & B_14000:
+            saidas_liquidas &= ~B_33000
+        if saidas_liquidas & B_31300 and saidas_liquidas & B_22000:
+            saidas_liquidas &= ~B_31300
+
+        if entradas_liquidas_filtradas & B_32000 and entradas_liquidas_filtradas & M_APOSENTADORIA:
+            entradas_liquidas_filtradas &= ~B_32000
+        if entradas_liquidas_filtradas & B_33000 and entradas_liquidas_filtradas & B_14000:
+            entradas_liquidas_filtradas &= ~B_33000
+        if entradas_liquidas_filtradas & B_31300 and entradas_liquidas_filtradas & B_22000:
+            entradas_liquidas_filtradas &= ~B_31300
+
+        n_saidas_liquidas = saidas_liquidas.bit_count()
+        n_entradas_liquidas = entradas_liquidas_filtradas.bit_count()
+
+        # Classificação de passos (aplicada de uma vez após o loop)
+        grupo_classificado[id_grupo] = True
+        grupo_saida_aposentadoria[id_grupo] = bool(saida & M_APOSENTADORIA)
+        grupo_saida_pensao[id_grupo] = bool(saida & B_14000)
+        grupo_saida_autopatrocinado[id_grupo] = bool(saida & B_22000)
+        base_chave = id_grupo << 32
+        chaves_saidas_liquidas.extend(base_chave | c for c in _codigos(saidas_liquidas))
 
         msg = ''
         gravidade = 'OK'
 
         # Tratamento especial para códigos consolidadores corretos
-        if len(saidas_liquidas) == 0 and len(entradas_liquidas) == 0:
+        if not saidas_liquidas and not entradas_liquidas:
             # Se só tem códigos consolidadores e eles estão corretos
-            codigos_consolidadores = {31000, 32000, 33000}
-            tem_consolidador = bool(codigos_entrada_set & codigos_consolidadores)
-            
+            tem_consolidador = bool(entrada & M_CONSOLIDADORES)
+
             if tem_consolidador and not msg:  # Ainda não tem mensagem de erro
                 msg = f"OK: Lançamento consolidador correto"
                 gravidade = 'OK'
-                stats['ok'] += 1
 
         # ERRO: Múltiplas saídas líquidas (após filtrar códigos de ruído)
-        if len(saidas_liquidas) > 1:
-            msg = f"ERRO: Participante tem múltiplas saídas finais no mesmo mês ({', '.join(map(str, saidas_liquidas))}). Isso é muito raro e pode indicar problema no sistema."
+        if n_saidas_liquidas > 1:
+            # Códigos listados em ordem crescente, direto da máscara final
+            msg = f"ERRO: Participante tem múltiplas saídas finais no mesmo mês ({', '.join(map(str, _codigos(saidas_liquidas)))}). Isso é muito raro e pode indicar problema no sistema."
             gravidade = 'ERRO'
-            stats['erros'] += 1
 
-        elif len(entradas_liquidas_filtradas) > 1:
-            if saidas_liquidas == {31200} and entradas_liquidas_filtradas == {21000, 31300}:
+        elif n_entradas_liquidas > 1:
+            if B_31200 and saidas_liquidas == B_31200 and entradas_liquidas_filtradas == M_DESTINO_31200_ACEITO:
                 msg = f"OK: Transição aceita 31200 → (21000 + 31300)"
                 gravidade = 'OK'
-                stats['ok'] += 1
             else:
                 msg = f"ERRO: Múltiplas entradas finais"
                 gravidade = 'ERRO'
-                stats['erros'] += 1
 
-        elif len(saidas_liquidas) == 1 and len(entradas_liquidas_filtradas) == 1:
-            cod_origem = list(saidas_liquidas)[0]
-            cod_destino = list(entradas_liquidas_filtradas)[0]
+        elif n_saidas_liquidas == 1 and n_entradas_liquidas == 1:
+            cod_origem = codigos_mes[saidas_liquidas.bit_length() - 1]
+            cod_destino = codigos_mes[entradas_liquidas_filtradas.bit_length() - 1]
 
-            if (cod_origem, cod_destino) in regras_validas:
+            if ((cod_origem << 32) | cod_destino) in regras_validas:
                 if cod_origem == 21000 and cod_destino in {31100, 31200, 31300, 22000}:
                     msg = f"ERRO: BPD não pode retornar para Ativo"
                     gravidade = 'ERRO'
-                    stats['erros'] += 1
                 else:
-                    msg = f"OK: Transição válida {get_descricao(cod_origem, df_codigos)} → {get_descricao(cod_destino, df_codigos)}"
+                    msg = _msg_transicao_valida(cod_origem, cod_destino)
                     gravidade = 'OK'
-                    stats['ok'] += 1
             else:
-                msg = f"ERRO: Transição NÃO PERMITIDA {cod_origem} → {cod_destino}"
+                msg = _msg_transicao_nao_permitida(cod_origem, cod_destino)
                 gravidade = 'ERRO'
-                stats['erros'] += 1
 
-        elif len(saidas_liquidas) == 0 and len(entradas_liquidas_filtradas) > 0:
-            cod_entrada = list(entradas_liquidas_filtradas)[0]
-            
+        elif n_saidas_liquidas == 0 and n_entradas_liquidas > 0:
+            cod_entrada = codigos_mes[entradas_liquidas_filtradas.bit_length() - 1]
+
             # Verifica se há saída de autopatrocinado (22000) com consolidador (31300)
-            if 22000 in codigos_saida_set and 31300 in codigos_saida_set and cod_entrada in {11100, 11200}:
-                if 32000 in codigos_entrada_set:
+            if saida & B_22000 and saida & B_31300 and cod_entrada in {11100, 11200}:
+                if entrada & B_32000:
                     msg = f"OK: Transição válida Autopatrocinado → Aposentadoria com consolidadores corretos"
                     gravidade = 'OK'
-                    stats['ok'] += 1
                 else:
                     msg = f"INFO: Processo em andamento"
                     gravidade = 'INFO'
-                    stats['info'] += 1
             else:
-                plano = group['PLANO'].iloc[0] if 'PLANO' in group.columns else None
-                if plano == 5 and cod_entrada in constantes['CODIGOS_ADMISSAO']:
+                plano = plano_linha[posicoes_grupo[0]] if plano_linha is not None else None
+                if plano == 5 and cod_entrada in codigos_admissao:
                     msg = f"INFO: Nova admissão no Plano 5"
                     gravidade = 'INFO'
-                    stats['info'] += 1
                 else:
                     msg = f"INFO: Processo em andamento"
                     gravidade = 'INFO'
-                    stats['info'] += 1
 
-
-        elif len(saidas_liquidas) == 0 and len(entradas_liquidas_filtradas) == 0 and len(entradas_independentes_liquidas) > 0:
-            msg = f"OK: Lançamento(s) independente(s) ({', '.join(map(str, sorted(entradas_independentes_liquidas)))})"
+        elif n_saidas_liquidas == 0 and n_entradas_liquidas == 0 and entrada_independente:
+            msg = f"OK: Lançamento(s) independente(s) ({', '.join(map(str, _codigos(entrada_independente)))})"
             gravidade = 'OK'
-            stats['ok'] += 1
 
-        elif len(saidas_liquidas) > 0 and len(entradas_liquidas_filtradas) == 0:
+        elif n_saidas_liquidas > 0 and n_entradas_liquidas == 0:
             # Verifica se há códigos consolidadores correspondentes corretos
             tem_consolidador_correto = False
-            
+
             # Para saídas de aposentadoria (11100, 11200) com 32000
-            if saidas_liquidas & {11100, 11200} and 32000 in codigos_saida_set:
+            if saidas_liquidas & M_APOSENTADORIA and saida & B_32000:
                 tem_consolidador_correto = True
-            
+
             # Para saída de pensão (14000) com 33000
-            if 14000 in saidas_liquidas and 33000 in codigos_saida_set:
+            if saidas_liquidas & B_14000 and saida & B_33000:
                 tem_consolidador_correto = True
 
-            if 34000 in saidas_liquidas and len(saidas_liquidas) == 1:
+            if saidas_liquidas & B_34000 and n_saidas_liquidas == 1:
                 msg = "OK: Lançamento independente (34000 - Designados/Dependentes)"
                 gravidade = 'OK'
-                stats['ok'] += 1
             elif tem_consolidador_correto:
                 msg = f"OK: Saída correta com lançamento consolidador correspondente"
                 gravidade = 'OK'
-                stats['ok'] += 1
-            elif 22000 in saidas_liquidas:
+            elif saidas_liquidas & B_22000:
                 msg = f"INFO: Saída de autopatrocinado (22000) aguardando entrada em nova situação"
                 gravidade = 'INFO'
-                stats['info'] += 1
             else:
                 msg = f"INFO: Processo em andamento (aguardando conclusão)"
                 gravidade = 'INFO'
-                stats['info'] += 1
 
         # Ajuste: 14000+33000 em entrada sem saída de ativo → pelo menos INFO
-        if 14000 in codigos_entrada_set and 33000 in codigos_entrada_set:
-            if not (codigos_saida_set & {31100, 31200, 22000, 11100, 11200}):
+        if entrada & B_14000 and entrada & B_33000:
+            if not (saida & M_ORIGEM_PENSAO):
                 if gravidade == 'OK':
                     msg = "INFO: Entrada de pensão (14000+33000) sem saída de ativo correspondente - verificar"
                     gravidade = 'INFO'
 
         if msg:
-            df_mes.loc[group.index, 'ANALISE'] = msg
-            df_mes.loc[group.index, 'GRAVIDADE'] = gravidade
+            registros_pos.append(posicoes_grupo)
+            registros_msg.append(msg)
+            registros_grav.append(gravidade)
+
+    # GRAVIDADE trabalhada direto nos códigos da categoria (0=OK, 1=INFO, 2=ERRO)
+    gravidade_cod = df_mes['GRAVIDADE'].cat.codes.to_numpy().copy()
+    if registros_pos:
+        tamanhos = [len(pos) for pos in registros_pos]
+        todas_pos = np.concatenate(registros_pos)
+        todas_msg = np.repeat(np.array(registros_msg, dtype=object), tamanhos)
+        todas_grav = np.repeat(GRAVIDADE_DTYPE.categories.get_indexer(registros_grav).astype(np.int8), tamanhos)
+        # A última gravação de cada linha prevalece, como nas atribuições sequenciais
+        _, ultima = np.unique(todas_pos[::-1], return_index=True)
+        sel = len(todas_pos) - 1 - ultima
+        analise = df_mes['ANALISE'].to_numpy(dtype=object, copy=True)
+        analise[todas_pos[sel]] = todas_msg[sel]
+        gravidade_cod[todas_pos[sel]] = todas_grav[sel]
+        df_mes['ANALISE'] = analise
+        df_mes['GRAVIDADE'] = pd.Categorical.from_codes(gravidade_cod, dtype=GRAVIDADE_DTYPE)
+
+    # Estatísticas por participante pela pior gravidade (ordem da categoria), numa única passada
+    pior = np.zeros(n_grupos, dtype=np.int64)
+    np.maximum.at(pior, pid_linha, gravidade_cod)
+    contagem = np.bincount(pior, minlength=3)
+    stats = {'total': n_grupos, 'erros': int(contagem[2]), 'info': int(contagem[1]), 'ok': int(contagem[0])}
+
+    # Classificação de passos: uma única passada vetorizada sobre todas as linhas
+    id_grupo_linha = pid_linha
+    chave_linha = (pid_linha << 32) | cod_linha.astype(np.int64)
+    classificado = grupo_classificado[id_grupo_linha]
+
+    # Independentes, entradas líquidas e intermediários de todos os participantes de uma vez,
+    # como diferença/interseção de arrays ordenados de chaves (participante, código)
+    chaves_entrada = np.unique(chave_linha[is_entrada])
+    chaves_saida = np.unique(chave_linha[is_saida])
+    eh_independente = np.isin(chaves_entrada & 0xFFFFFFFF, constantes['CODIGOS_INDEPENDENTES_ARR'])
+    chaves_independentes = chaves_entrada[eh_independente]
+    chaves_entrada_principal = chaves_entrada[~eh_independente]
+    chaves_entradas_liquidas = np.setdiff1d(chaves_entrada_principal, chaves_saida, assume_unique=True)
+    chaves_intermediarios = np.intersect1d(chaves_saida, chaves_entrada_principal, assume_unique=True)
+
+    condicoes = [
+        is_entrada & np.isin(chave_linha, chaves_independentes),
+        cod_linha == 34000,
+        (cod_linha == 32000) & is_saida & grupo_saida_aposentadoria[id_grupo_linha],
+        (cod_linha == 33000) & is_saida & grupo_saida_pensao[id_grupo_linha],
+        (cod_linha == 31300) & is_saida & grupo_saida_autopatrocinado[id_grupo_linha],
+        is_saida & np.isin(chave_linha, chaves_saidas_liquidas),
+        is_entrada & np.isin(chave_linha, chaves_entradas_liquidas),
+        np.isin(chave_linha, chaves_intermediarios),
+    ]
+    escolhas = ['0. Independente', '0. Independente', '3. Fim', '3. Fim',
+                '1. Início', '1. Início', '3. Fim', '2. Intermediário']
+    codigos_escolhas = TIPO_PASSO_DTYPE.categories.get_indexer(escolhas)
+    df_mes['TIPO_PASSO'] = pd.Categorical.from_codes(
+        np.select([classificado & c for c in condicoes], codigos_escolhas, default=0).astype(np.int8),
+        dtype=TIPO_PASSO_DTYPE)
+
+    df_mes = df_mes.drop(columns='_pid')
 
     return df_mes, stats
 
@@ -484,23 +621,21 @@ def calcular_stats_participantes(df_res):
     if df_res is None or df_res.empty:
         return {'total': 0, 'erros': 0, 'info': 0, 'ok': 0}
 
-    def pior_gravidade(series):
-        vals = set(series.dropna().astype(str).tolist())
-        if 'ERRO' in vals:
-            return 'ERRO'
-        if 'INFO' in vals:
-            return 'INFO'
-        return 'OK'
-
-    por_participante = df_res.groupby('CODIGO ORGANIZACAO NOME')['GRAVIDADE'].apply(pior_gravidade)
-    total = int(por_participante.shape[0])
-    counts = por_participante.value_counts()
+    # Pior gravidade por participante = máximo dos códigos da categoria ordenada (OK < INFO < ERRO);
+    # valores fora da categoria (ou nulos) viram -1 e contam como OK
+    pid, participantes = pd.factorize(df_res['CODIGO ORGANIZACAO NOME'])
+    codigos = pd.Categorical(df_res['GRAVIDADE'], dtype=GRAVIDADE_DTYPE).codes.astype(np.int64)
+    validos = pid >= 0
+    pior = np.zeros(len(participantes), dtype=np.int64)
+    np.maximum.at(pior, pid[validos], codigos[validos])
+    total = len(participantes)
+    contagem = np.bincount(pior, minlength=3)
 
     return {
         'total': total,
-        'erros': int(counts.get('ERRO', 0)),
-        'info': int(counts.get('INFO', 0)),
-        'ok': int(counts.get('OK', 0))
+        'erros': int(contagem[2]),
+        'info': int(contagem[1]),
+        'ok': int(contagem[0])
     }
 
 def pos_processar_cross_month(df_res):
@@ -508,7 +643,7 @@ def pos_processar_cross_month(df_res):
     CODIGOS_ATIVO = {31100, 31200}
     CODIGOS_DESTINO_VALIDO = {11100, 11200, 14000, 21000, 23000, 24100, 24200}
 
-    for participante, group in df_res.groupby('CODIGO ORGANIZACAO NOME'):
+    for participante, group in df_res.groupby('CODIGO ORGANIZACAO NOME', sort=False):
         todas_saidas = set(group[group['MOVIMENTO'] == 'SAIDA']['CODIGO BENEFICIO'])
         todas_entradas = set(group[group['MOVIMENTO'] == 'ENTRADA']['CODIGO BENEFICIO'])
 
@@ -567,14 +702,18 @@ def pos_processar_cross_month(df_res):
     return df_res
 
 def analisar_movimentacoes_periodo(df_mov, df_codigos, regras_validas, constantes, meses):
+    # Posições de cada mês numa única passada, em vez de um filtro sobre o frame inteiro por mês
+    posicoes_por_mes = df_mov.groupby('ANO MES', sort=False).indices
     dfs = []
     for mes in meses:
-        df_mes, _stats_mes = analisar_movimentacoes_mes(
-            df_mov,
+        posicoes = posicoes_por_mes.get(mes)
+        if posicoes is None:
+            continue
+        df_mes, _stats_mes = _analisar_mes_recortado(
+            df_mov.take(posicoes),
             df_codigos,
             regras_validas,
-            constantes,
-            mes_analise=mes
+            constantes
         )
         if df_mes is not None and not df_mes.empty:
             dfs.append(df_mes)
@@ -588,22 +727,205 @@ def analisar_movimentacoes_periodo(df_mov, df_codigos, regras_validas, constante
     return df_res, stats
 
 
-def _mpl_fig_to_png_bytes(fig):
+def calcular_contagem_transicoes(df_res):
+    """Contagem de pares saída → entrada do mesmo participante no mesmo mês, por (origem, destino)"""
+    # Cada código é contado uma vez por participante/mês em cada lado e os pares são ponderados
+    # pelo produto das multiplicidades: mesmo resultado da junção linha a linha, sem materializar o
+    # produto cartesiano das saídas x entradas de cada grupo
+    pid, _ = pd.factorize(df_res['CODIGO ORGANIZACAO NOME'])
+    base = pd.DataFrame({
+        '_pid': pid,
+        'ANO MES': df_res['ANO MES'].to_numpy(),
+        'CODIGO BENEFICIO': df_res['CODIGO BENEFICIO'].to_numpy()
+    })
+    movimento = df_res['MOVIMENTO']
+    chaves = ['_pid', 'ANO MES', 'CODIGO BENEFICIO']
+    saidas = base[(movimento == 'SAIDA').to_numpy()].groupby(chaves, sort=False).size().reset_index(name='_n')
+    entradas = base[(movimento == 'ENTRADA').to_numpy()].groupby(chaves, sort=False).size().reset_index(name='_n')
+    pares = saidas.merge(entradas, on=['_pid', 'ANO MES'], suffixes=('_origem', '_destino'))
+    pares['_n'] = pares['_n_origem'] * pares['_n_destino']
+    contagem = pares.groupby(['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino'])['_n'].sum()
+    contagem.name = None
+    return contagem
+
+
+def _hash_dataframe(df):
+    """Hash do conteúdo completo do DataFrame (o hash padrão do Streamlit amostra frames grandes)"""
+    return hashlib.md5(pd.util.hash_pandas_object(df, index=True).to_numpy()).hexdigest()
+
+
+@st.cache_data(max_entries=32, show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
+def analisar_movimentacoes_mes_cache(df_mov, _df_codigos, _regras_validas, _constantes, mes_analise):
+    """analisar_movimentacoes_mes com cache por (dados, mês); a base de conhecimento não entra no hash"""
+    return analisar_movimentacoes_mes(df_mov, _df_codigos, _regras_validas, _constantes, mes_analise=mes_analise)
+
+
+@st.cache_data(max_entries=32, show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
+def calcular_agregados_estatisticas(df_res, erros):
+    """KPIs e contagens da aba de estatísticas, com cache pelo conteúdo do resultado analisado"""
+    total_movs = len(df_res)
+    total_participantes = df_res['CODIGO ORGANIZACAO NOME'].nunique()
+    taxa_erro = (erros / total_participantes * 100) if total_participantes > 0 else 0
+    kpis = {
+        'total_movs': total_movs,
+        'total_participantes': total_participantes,
+        'taxa_erro': taxa_erro,
+        'taxa_conformidade': 100 - taxa_erro,
+        'media_movs_participante': total_movs / total_participantes if total_participantes > 0 else 0
+    }
+    chaves_contagem = [c for c in ['PLANO', 'GRAVIDADE', 'CODIGO BENEFICIO'] if c in df_res.columns]
+    contagem_base = df_res.groupby(chaves_contagem, observed=True, dropna=False, sort=False).size()
+    contagem_transicoes = calcular_contagem_transicoes(df_res)
+    return kpis, contagem_base, int(contagem_transicoes.sum()), contagem_transicoes
+
+
+@st.cache_resource(show_spinner=False)
+def _tabela_codigos_arrow(_df_codigos):
+    """Tabela de referência dos códigos convertida para Arrow uma única vez (a base é constante)"""
+    import pyarrow as pa
+    return pa.Table.from_pandas(_df_codigos, preserve_index=False)
+
+
+def _codigos_mais_frequentes(contagem_transicoes, n=20):
+    """Códigos que mais aparecem nas transições (origem ou destino), somados das contagens por par"""
+    por_origem = contagem_transicoes.groupby(level='CODIGO BENEFICIO_origem').sum()
+    por_destino = contagem_transicoes.groupby(level='CODIGO BENEFICIO_destino').sum()
+    total = pd.concat([por_origem, por_destino]).groupby(level=0).sum()
+    return total.nlargest(n).index.tolist()
+
+
+def _matriz_transicoes_top(contagem_transicoes, top_codes):
+    """Matriz origem x destino dos códigos mais frequentes, montada das contagens longas (None se vazia)"""
+    origem = contagem_transicoes.index.get_level_values('CODIGO BENEFICIO_origem').to_numpy()
+    destino = contagem_transicoes.index.get_level_values('CODIGO BENEFICIO_destino').to_numpy()
+    codigos = np.array(sorted(top_codes))
+    no_recorte = np.isin(origem, codigos) & np.isin(destino, codigos)
+    if not no_recorte.any():
+        return None
+    # Matriz densa preenchida por posição (pares únicos nas contagens), sem unstack + reindex
+    matriz = np.zeros((len(codigos), len(codigos)), dtype=np.int64)
+    matriz[np.searchsorted(codigos, origem[no_recorte]), np.searchsorted(codigos, destino[no_recorte])] = (
+        contagem_transicoes.to_numpy()[no_recorte])
+    return pd.DataFrame(
+        matriz,
+        index=pd.Index(codigos, name='CODIGO BENEFICIO_origem'),
+        columns=pd.Index(codigos, name='CODIGO BENEFICIO_destino')
+    )
+
+
+def _contagem_plano_gravidade(df_res):
+    """Tabela plano x gravidade (colunas OK, INFO, ERRO) por bincount 2-D, sem groupby + unstack"""
+    gravidade = pd.Categorical(df_res['GRAVIDADE'], dtype=GRAVIDADE_DTYPE).codes
+    validos = gravidade >= 0
+    plano_codigos, planos = pd.factorize(df_res['PLANO'][validos], sort=True)
+    n_grav = len(GRAVIDADE_DTYPE.categories)
+    validos_plano = plano_codigos >= 0
+    contagem = np.bincount(
+        plano_codigos[validos_plano].astype(np.int64) * n_grav + gravidade[validos][validos_plano],
+        minlength=len(planos) * n_grav
+    ).reshape(len(planos), n_grav)
+    return pd.DataFrame(contagem, index=pd.Index(planos, name='PLANO'), columns=list(GRAVIDADE_DTYPE.categories))
+
+
+# Ajustes visuais dos gráficos matplotlib dos relatórios PDF
+_RC_MPL = {
+    'figure.facecolor': 'white',
+    'axes.facecolor': 'white',
+    'savefig.facecolor': 'white',
+    'axes.edgecolor': '#E5E7EB',
+    'axes.labelcolor': '#111827',
+    'text.color': '#111827',
+    'xtick.color': '#374151',
+    'ytick.color': '#374151',
+    'grid.color': '#E5E7EB',
+    'grid.alpha': 0.6,
+    'axes.titleweight': 'bold',
+    'axes.titlesize': 14,
+    'axes.labelsize': 11,
+    'font.size': 11,
+    'legend.frameon': False,
+}
+
+
+@lru_cache(maxsize=None)
+def _aplicar_estilo_mpl():
+    """Aplica o estilo dos gráficos uma única vez por processo (rcParams é global)"""
     import matplotlib.pyplot as plt
+    import matplotlib as mpl
+    try:
+        plt.style.use('seaborn-v0_8-whitegrid')
+    except Exception:
+        try:
+            plt.style.use('ggplot')
+        except Exception:
+            pass
+
+    mpl.rcParams.update(_RC_MPL)
+
+
+def _nova_figura(figsize):
+    """Figura e eixo criados fora do pyplot (sem registro no gerenciador global de figuras)"""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    return fig, fig.add_subplot()
+
+
+# Quadro das imagens nos PDFs: largura útil de 17 cm e altura de até 62% dela (relatório visual)
+_QUADRO_PDF_POL = (17 / 2.54, 17 * 0.62 / 2.54)
+_DPI_EFETIVO_MIN = 250
+
+
+def _dpi_para_figura(fig):
+    """Menor dpi (até 300) que garante _DPI_EFETIVO_MIN depois de a figura ser ajustada ao quadro"""
+    largura, altura = fig.get_size_inches()
+    # O relatório visual estica a imagem até o quadro nos dois eixos: vale o eixo menos reduzido
+    reducao = min(largura / _QUADRO_PDF_POL[0], altura / _QUADRO_PDF_POL[1])
+    return min(300, int(np.ceil(_DPI_EFETIVO_MIN / reducao)))
+
+
+def _mpl_fig_to_png_bytes(fig):
     bio = io.BytesIO()
+    # O reportlab decodifica o PNG e recomprime os pixels no PDF: compressão mínima aqui
+    # (o PDF resultante é o mesmo, só a codificação intermediária fica mais barata)
     fig.savefig(
         bio,
         format='png',
-        dpi=300,
+        dpi=_dpi_para_figura(fig),
         bbox_inches='tight',
         facecolor='white',
-        edgecolor='white'
+        edgecolor='white',
+        pil_kwargs={'compress_level': 1}
     )
-    plt.close(fig)
     bio.seek(0)
     return bio.getvalue()
 
 
+def _contagem_por_codigo(df, df_codigos, nome, colunas):
+    """Conta linhas por código e anexa colunas da base de códigos via map (sem merge)."""
+    contagem = df.groupby('CODIGO BENEFICIO').size().reset_index(name=nome)
+    base = df_codigos.set_index('CODIGO')
+    for col in colunas:
+        contagem[col] = contagem['CODIGO BENEFICIO'].map(base[col])
+    return contagem
+
+
+def _erros_com_tipo(df_res):
+    """Linhas com gravidade ERRO e o tipo de erro extraído da mensagem (None se não houver erros)"""
+    if 'GRAVIDADE' not in df_res.columns:
+        return None
+    # Máscara calculada uma vez e usada tanto no teste quanto na seleção (sem cópia do frame inteiro)
+    mask_erro = (df_res['GRAVIDADE'] == 'ERRO').to_numpy()
+    if not mask_erro.any():
+        return None
+    erros_df = df_res[mask_erro]
+    # As mensagens se repetem muito: regex (kernel do Arrow) só sobre as mensagens distintas,
+    # espalhada de volta para as linhas pelos códigos do factorize
+    codigos, mensagens = pd.factorize(erros_df['ANALISE'])
+    tipos = pd.Series(mensagens).astype('string[pyarrow]').str.extract(r'ERRO: ([^.]+)', expand=False)
+    return erros_df.assign(
+        TIPO_ERRO=pd.Series(tipos.array.take(codigos, allow_fill=True), index=erros_df.index))
+
+
 def gerar_pdf_relatorio_simples(titulo, subtitulo, kpis, df_res):
     try:
         from reportlab.lib.pagesizes import A4
@@ -664,8 +986,6 @@ def gerar_pdf_relatorio_simples(titulo, subtitulo, kpis, df_res):
 
 
 def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
-    import matplotlib.pyplot as plt
-    import matplotlib as mpl
     try:
         from reportlab.lib.pagesizes import A4
         from reportlab.lib.units import cm
@@ -753,33 +1073,6 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
         canvas.drawRightString(width - 2 * cm, 1.1 * cm, f"Página {_doc.page}")
         canvas.restoreState()
 
-    def _aplicar_estilo_mpl():
-        try:
-            plt.style.use('seaborn-v0_8-whitegrid')
-        except Exception:
-            try:
-                plt.style.use('ggplot')
-            except Exception:
-                pass
-
-        mpl.rcParams.update({
-            'figure.facecolor': 'white',
-            'axes.facecolor': 'white',
-            'savefig.facecolor': 'white',
-            'axes.edgecolor': '#E5E7EB',
-            'axes.labelcolor': '#111827',
-            'text.color': '#111827',
-            'xtick.color': '#374151',
-            'ytick.color': '#374151',
-            'grid.color': '#E5E7EB',
-            'grid.alpha': 0.6,
-            'axes.titleweight': 'bold',
-            'axes.titlesize': 14,
-            'axes.labelsize': 11,
-            'font.size': 11,
-            'legend.frameon': False,
-        })
-
     def _despine(ax):
         for s in ['top', 'right', 'left', 'bottom']:
             try:
@@ -889,7 +1182,7 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
     story.append(Paragraph("Visão Geral", section_style))
     _aplicar_estilo_mpl()
 
-    grav = df_res.groupby('GRAVIDADE').size().reindex(['OK', 'INFO', 'ERRO']).fillna(0).astype(int)
+    grav = df_res.groupby('GRAVIDADE', observed=True, sort=False).size().reindex(['OK', 'INFO', 'ERRO']).fillna(0).astype(int)
 
     # Tabela resumo de gravidade
     total_geral = int(grav.sum()) if not grav.empty else 0
@@ -902,7 +1195,7 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
     story.append(Spacer(1, 0.7 * cm))
 
     # Gráfico de gravidade (donut)
-    fig, ax = plt.subplots(figsize=(7.6, 4.4))
+    fig, ax = _nova_figura(figsize=(7.6, 4.4))
     colors_grav = ['#22C55E', '#06B6D4', '#EF4444']
     wedges, texts, autotexts = ax.pie(
         grav.values,
@@ -918,29 +1211,24 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
     add_mpl_fig(fig)
 
     if 'PLANO' in df_res.columns:
-        plano_grav = df_res.groupby(['PLANO', 'GRAVIDADE']).size().unstack(fill_value=0)
-        plano_grav = plano_grav.reindex(columns=['OK', 'INFO', 'ERRO'], fill_value=0)
+        plano_grav = _contagem_plano_gravidade(df_res)
 
         # Tabela por plano (Top 12)
         plano_tab = plano_grav.copy()
         plano_tab['TOTAL'] = plano_tab.sum(axis=1)
         plano_tab = plano_tab.sort_values('TOTAL', ascending=False).head(12)
         tab_plano = [["Plano", "OK", "INFO", "ERRO", "Total"]]
-        for plano, row in plano_tab.iterrows():
-            tab_plano.append([
-                str(plano),
-                _fmt_int(row.get('OK', 0)),
-                _fmt_int(row.get('INFO', 0)),
-                _fmt_int(row.get('ERRO', 0)),
-                _fmt_int(row.get('TOTAL', 0)),
-            ])
+        for plano, ok, info, erro, total in zip(
+                plano_tab.index, plano_tab['OK'].to_numpy(), plano_tab['INFO'].to_numpy(),
+                plano_tab['ERRO'].to_numpy(), plano_tab['TOTAL'].to_numpy()):
+            tab_plano.append([str(plano), _fmt_int(ok), _fmt_int(info), _fmt_int(erro), _fmt_int(total)])
         story.append(_tabela_estilizada(
             tab_plano,
             col_widths=[doc.width * 0.34, doc.width * 0.165, doc.width * 0.165, doc.width * 0.165, doc.width * 0.165]
         ))
         story.append(Spacer(1, 0.7 * cm))
 
-        fig, ax = plt.subplots(figsize=(9.2, 4.9))
+        fig, ax = _nova_figura(figsize=(9.2, 4.9))
         x = np.arange(len(plano_grav.index))
         w = 0.25
         ax.bar(x - w, plano_grav['OK'].values, width=w, label='OK', color='#22C55E')
@@ -959,35 +1247,33 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
     story.append(PageBreak())
     story.append(Paragraph("Códigos e Benefícios", section_style))
 
-    mov_por_codigo = df_res.groupby('CODIGO BENEFICIO').size().reset_index(name='count')
-    mov_por_codigo = mov_por_codigo.merge(
-        df_codigos[['CODIGO', 'DESCRICAO', 'TIPO']],
-        left_on='CODIGO BENEFICIO',
-        right_on='CODIGO',
-        how='left'
-    )
+    mov_por_codigo = _contagem_por_codigo(df_res, df_codigos, 'count', ('DESCRICAO', 'TIPO'))
     total_mov = float(mov_por_codigo['count'].sum()) if not mov_por_codigo.empty else 0.0
     mov_por_codigo['percentual'] = (mov_por_codigo['count'] / total_mov * 100) if total_mov else 0.0
-    top10 = mov_por_codigo.nlargest(10, 'count').sort_values('count', ascending=True)
+    # Uma única ordenação: tabela na ordem decrescente, gráfico de barras horizontais na visão invertida
+    top10_desc = mov_por_codigo.nlargest(10, 'count')
+    top10 = top10_desc.iloc[::-1]
 
     # Tabela Top 10
     tab_top10 = [["Código", "Descrição", "Tipo", "Qtd", "%"]]
-    for _, r in top10.sort_values('count', ascending=False).iterrows():
-        tab_top10.append([
-            str(int(r['CODIGO BENEFICIO'])) if pd.notna(r.get('CODIGO BENEFICIO')) else "-",
-            str(r.get('DESCRICAO') if pd.notna(r.get('DESCRICAO')) else "-")[:60],
-            str(r.get('TIPO') if pd.notna(r.get('TIPO')) else "-"),
-            _fmt_int(r.get('count', 0)),
-            f"{float(r.get('percentual', 0.0)):.1f}%",
-        ])
+    # Colunas extraídas uma vez como arrays (códigos vêm das chaves do groupby, nunca nulos)
+    for cod, desc, tipo, qtd, pct in zip(
+            top10_desc['CODIGO BENEFICIO'].to_numpy(),
+            top10_desc['DESCRICAO'].astype(object).where(top10_desc['DESCRICAO'].notna(), '-').to_numpy(),
+            top10_desc['TIPO'].astype(object).where(top10_desc['TIPO'].notna(), '-').to_numpy(),
+            top10_desc['count'].to_numpy(),
+            top10_desc['percentual'].to_numpy()):
+        tab_top10.append([str(int(cod)), str(desc)[:60], str(tipo), _fmt_int(qtd), f"{float(pct):.1f}%"])
     story.append(_tabela_estilizada(
         tab_top10,
         col_widths=[doc.width * 0.13, doc.width * 0.50, doc.width * 0.17, doc.width * 0.10, doc.width * 0.10]
     ))
     story.append(Spacer(1, 0.7 * cm))
 
-    fig, ax = plt.subplots(figsize=(9.0, 5.0))
-    labels = top10['DESCRICAO'].fillna(top10['CODIGO BENEFICIO'].astype(str)).astype(str).map(lambda s: (s[:42] + '…') if len(s) > 43 else s)
+    fig, ax = _nova_figura(figsize=(9.0, 5.0))
+    labels = top10['DESCRICAO'].fillna(top10['CODIGO BENEFICIO'].astype(str)).astype(str)
+    # Truncagem vetorizada pelo acessor .str (sem lambda por linha)
+    labels = labels.where(labels.str.len() <= 43, labels.str.slice(0, 42) + '…')
     ax.barh(labels, top10['count'].values, color='#2563EB')
     ax.set_title('Top 10 Códigos Mais Utilizados')
     ax.set_xlabel('Quantidade')
@@ -995,17 +1281,18 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
     _despine(ax)
     add_mpl_fig(fig)
 
-    tipo_dist = mov_por_codigo.groupby('TIPO')['count'].sum().sort_values(ascending=True)
+    tipo_dist_desc = mov_por_codigo.groupby('TIPO', observed=True)['count'].sum().sort_values(ascending=False)
+    tipo_dist = tipo_dist_desc.iloc[::-1]
     if not tipo_dist.empty:
         tab_tipo = [["Tipo", "Quantidade", "%"]]
         total_tipo = float(tipo_dist.sum()) if float(tipo_dist.sum()) else 0.0
-        for tipo, qtd in tipo_dist.sort_values(ascending=False).items():
+        for tipo, qtd in tipo_dist_desc.items():
             perc = (float(qtd) / total_tipo * 100) if total_tipo else 0
             tab_tipo.append([str(tipo), _fmt_int(qtd), f"{perc:.1f}%"])
         story.append(_tabela_estilizada(tab_tipo, col_widths=[doc.width * 0.50, doc.width * 0.25, doc.width * 0.25]))
         story.append(Spacer(1, 0.7 * cm))
 
-        fig, ax = plt.subplots(figsize=(7.8, 4.4))
+        fig, ax = _nova_figura(figsize=(7.8, 4.4))
         ax.barh(tipo_dist.index.astype(str), tipo_dist.values, color='#F59E0B')
         ax.set_title('Distribuição por Tipo de Código')
         ax.set_xlabel('Quantidade')
@@ -1013,39 +1300,38 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
         _despine(ax)
         add_mpl_fig(fig)
 
-    transicoes = df_res[df_res['MOVIMENTO'] == 'SAIDA'].merge(
-        df_res[df_res['MOVIMENTO'] == 'ENTRADA'],
-        on=['CODIGO ORGANIZACAO NOME', 'ANO MES'],
-        suffixes=('_origem', '_destino')
-    )
-    if not transicoes.empty:
+    contagem_transicoes = calcular_contagem_transicoes(df_res)
+    if not contagem_transicoes.empty:
         story.append(PageBreak())
         story.append(Paragraph("Transições", section_style))
-        trans_grouped = transicoes.groupby(['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().reset_index(name='count')
-        trans_grouped = trans_grouped.nlargest(15, 'count').sort_values('count', ascending=True)
+        trans_desc = contagem_transicoes.reset_index(name='count').nlargest(15, 'count')
+        trans_grouped = trans_desc.iloc[::-1]
 
         # Tabela de transições (Top 15)
-        codigo_to_desc = df_codigos.set_index('CODIGO')['DESCRICAO'].to_dict() if df_codigos is not None and not df_codigos.empty else {}
+        descricoes = (df_codigos.set_index('CODIGO')['DESCRICAO']
+                      if df_codigos is not None and not df_codigos.empty else pd.Series(dtype=object))
         tab_trans = [["Origem", "Destino", "Qtd"]]
-        for _, r in trans_grouped.sort_values('count', ascending=False).iterrows():
-            o = int(r['CODIGO BENEFICIO_origem'])
-            d = int(r['CODIGO BENEFICIO_destino'])
-            o_desc = str(codigo_to_desc.get(o, ""))
-            d_desc = str(codigo_to_desc.get(d, ""))
+        # Descrições de origem e destino buscadas por coluna inteira (map), não por linha
+        for o, d, o_desc, d_desc, qtd in zip(
+                trans_desc['CODIGO BENEFICIO_origem'].tolist(),
+                trans_desc['CODIGO BENEFICIO_destino'].tolist(),
+                trans_desc['CODIGO BENEFICIO_origem'].map(descricoes).fillna('').tolist(),
+                trans_desc['CODIGO BENEFICIO_destino'].map(descricoes).fillna('').tolist(),
+                trans_desc['count'].to_numpy()):
             origem = f"{o} - {o_desc[:35]}".strip(" -")
             destino = f"{d} - {d_desc[:35]}".strip(" -")
-            tab_trans.append([origem, destino, _fmt_int(r['count'])])
+            tab_trans.append([origem, destino, _fmt_int(qtd)])
         story.append(_tabela_estilizada(
             tab_trans,
             col_widths=[doc.width * 0.44, doc.width * 0.44, doc.width * 0.12]
         ))
         story.append(Spacer(1, 0.7 * cm))
 
-        labels = trans_grouped.apply(
-            lambda row: f"{int(row['CODIGO BENEFICIO_origem'])}→{int(row['CODIGO BENEFICIO_destino'])}",
-            axis=1
+        labels = (
+            trans_grouped['CODIGO BENEFICIO_origem'].astype(int).astype(str) + "→" +
+            trans_grouped['CODIGO BENEFICIO_destino'].astype(int).astype(str)
         )
-        fig, ax = plt.subplots(figsize=(9.2, 6.0))
+        fig, ax = _nova_figura(figsize=(9.2, 6.0))
         ax.barh(labels.tolist(), trans_grouped['count'].values, color='#10B981')
         ax.set_title('Top 15 Transições Mais Frequentes')
         ax.set_xlabel('Quantidade')
@@ -1053,16 +1339,10 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
         _despine(ax)
         add_mpl_fig(fig, max_height_cm=12.5)
 
-        top_codes = pd.concat([
-            transicoes['CODIGO BENEFICIO_origem'],
-            transicoes['CODIGO BENEFICIO_destino']
-        ]).value_counts().head(20).index.tolist()
-        matriz = transicoes.groupby(['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().reset_index(name='count')
-        matriz = matriz[matriz['CODIGO BENEFICIO_origem'].isin(top_codes) & matriz['CODIGO BENEFICIO_destino'].isin(top_codes)]
-        if not matriz.empty:
-            pivot = matriz.pivot(index='CODIGO BENEFICIO_origem', columns='CODIGO BENEFICIO_destino', values='count').fillna(0)
-            pivot = pivot.reindex(index=sorted(top_codes), columns=sorted(top_codes), fill_value=0)
-            fig, ax = plt.subplots(figsize=(10.0, 7.0))
+        top_codes = _codigos_mais_frequentes(contagem_transicoes)
+        pivot = _matriz_transicoes_top(contagem_transicoes, top_codes)
+        if pivot is not None:
+            fig, ax = _nova_figura(figsize=(10.0, 7.0))
             im = ax.imshow(pivot.values, aspect='auto', cmap='RdYlGn')
             ax.set_title('Heatmap de Transições (Top 20 códigos)')
             ax.set_xlabel('Destino')
@@ -1074,23 +1354,23 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
             fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
             add_mpl_fig(fig, max_height_cm=13.5)
 
-    if 'GRAVIDADE' in df_res.columns and (df_res['GRAVIDADE'] == 'ERRO').any():
-        erros_df = df_res[df_res['GRAVIDADE'] == 'ERRO'].copy()
-        erros_df['TIPO_ERRO'] = erros_df['ANALISE'].astype(str).str.extract(r'ERRO: ([^.]+)')[0]
-        tipo_erro_counts = erros_df.groupby('TIPO_ERRO').size().sort_values(ascending=True).tail(10)
+    erros_df = _erros_com_tipo(df_res)
+    if erros_df is not None:
+        tipo_erro_desc = erros_df.groupby('TIPO_ERRO').size().nlargest(10)
+        tipo_erro_counts = tipo_erro_desc.iloc[::-1]
         story.append(PageBreak())
         story.append(Paragraph("Erros", section_style))
 
         # Tabela tipos de erro
         if not tipo_erro_counts.empty:
             tab_erro_tipo = [["Tipo de Erro", "Qtd"]]
-            for tipo, qtd in tipo_erro_counts.sort_values(ascending=False).items():
+            for tipo, qtd in tipo_erro_desc.items():
                 tab_erro_tipo.append([str(tipo)[:70], _fmt_int(qtd)])
             story.append(_tabela_estilizada(tab_erro_tipo, col_widths=[doc.width * 0.82, doc.width * 0.18]))
             story.append(Spacer(1, 0.7 * cm))
 
         if not tipo_erro_counts.empty:
-            fig, ax = plt.subplots(figsize=(9.0, 5.2))
+            fig, ax = _nova_figura(figsize=(9.0, 5.2))
             ax.barh(tipo_erro_counts.index.fillna('Desconhecido').astype(str), tipo_erro_counts.values, color='#EF4444')
             ax.set_title('Top 10 Tipos de Erro')
             ax.set_xlabel('Quantidade')
@@ -1107,29 +1387,28 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
                 story.append(_tabela_estilizada(tab_erros_plano, col_widths=[doc.width * 0.78, doc.width * 0.22]))
                 story.append(Spacer(1, 0.7 * cm))
 
-                fig, ax = plt.subplots(figsize=(7.2, 4.4))
+                fig, ax = _nova_figura(figsize=(7.2, 4.4))
                 ax.pie(erros_plano.values, labels=[str(p) for p in erros_plano.index], autopct='%1.1f%%', startangle=90)
                 ax.set_title('Erros por Plano')
                 add_mpl_fig(fig)
 
-        cod_erro = erros_df.groupby('CODIGO BENEFICIO').size().reset_index(name='erros')
-        cod_erro = cod_erro.merge(df_codigos[['CODIGO', 'DESCRICAO']], left_on='CODIGO BENEFICIO', right_on='CODIGO', how='left')
-        cod_erro = cod_erro.sort_values('erros', ascending=False).head(10).sort_values('erros', ascending=True)
+        cod_erro = _contagem_por_codigo(erros_df, df_codigos, 'erros', ('DESCRICAO',))
+        cod_erro_desc = cod_erro.nlargest(10, 'erros')
+        cod_erro = cod_erro_desc.iloc[::-1]
         if not cod_erro.empty:
             tab_cod_erro = [["Código", "Descrição", "Qtd"]]
-            for _, r in cod_erro.sort_values('erros', ascending=False).iterrows():
-                tab_cod_erro.append([
-                    str(int(r['CODIGO BENEFICIO'])) if pd.notna(r.get('CODIGO BENEFICIO')) else "-",
-                    str(r.get('DESCRICAO') if pd.notna(r.get('DESCRICAO')) else "-")[:70],
-                    _fmt_int(r.get('erros', 0)),
-                ])
+            for cod, desc, qtd in zip(
+                    cod_erro_desc['CODIGO BENEFICIO'].to_numpy(),
+                    cod_erro_desc['DESCRICAO'].astype(object).where(cod_erro_desc['DESCRICAO'].notna(), '-').to_numpy(),
+                    cod_erro_desc['erros'].to_numpy()):
+                tab_cod_erro.append([str(int(cod)), str(desc)[:70], _fmt_int(qtd)])
             story.append(_tabela_estilizada(
                 tab_cod_erro,
                 col_widths=[doc.width * 0.15, doc.width * 0.67, doc.width * 0.18]
             ))
             story.append(Spacer(1, 0.7 * cm))
 
-            fig, ax = plt.subplots(figsize=(9.0, 5.2))
+            fig, ax = _nova_figura(figsize=(9.0, 5.2))
             labels = cod_erro['DESCRICAO'].fillna(cod_erro['CODIGO BENEFICIO'].astype(str)).astype(str)
             ax.barh(labels, cod_erro['erros'].values, color='#991B1B')
             ax.set_title('Top 10 Códigos com Mais Erros')
@@ -1144,7 +1423,6 @@ def gerar_pdf_relatorio_visual(titulo, subtitulo, kpis, df_res, df_codigos):
 
 
 def gerar_pdf_relatorio_sem_kaleido(titulo, subtitulo, kpis, df_res, df_codigos):
-    import matplotlib.pyplot as plt
     try:
         from reportlab.lib.pagesizes import A4
         from reportlab.pdfgen import canvas
@@ -1178,21 +1456,34 @@ def gerar_pdf_relatorio_sem_kaleido(titulo, subtitulo, kpis, df_res, df_codigos)
             y -= 0.45 * cm
         y -= 0.4 * cm
 
-    imagens = []
+    img_w = width - 4 * cm
+    img_h = img_w * (700 / 1200)
+
+    def desenhar_figura(fig):
+        # Cada figura vai para a página assim que é gerada: o canvas já grava a imagem no
+        # documento, então só um PNG fica em memória por vez
+        nonlocal y
+        img = ImageReader(io.BytesIO(_mpl_fig_to_png_bytes(fig)))
+
+        if y - img_h < 2 * cm:
+            c.showPage()
+            y = height - 2 * cm
+
+        c.drawImage(img, 2 * cm, y - img_h, width=img_w, height=img_h, preserveAspectRatio=True, anchor='c')
+        y -= img_h + 1 * cm
 
     # 1) Distribuição por gravidade
-    grav = df_res.groupby('GRAVIDADE').size().reindex(['OK', 'INFO', 'ERRO']).fillna(0).astype(int)
-    fig, ax = plt.subplots(figsize=(7.2, 4.2))
+    grav = df_res.groupby('GRAVIDADE', observed=True, sort=False).size().reindex(['OK', 'INFO', 'ERRO']).fillna(0).astype(int)
+    fig, ax = _nova_figura(figsize=(7.2, 4.2))
     colors = ['#28a745', '#17a2b8', '#dc3545']
     ax.pie(grav.values, labels=grav.index.tolist(), autopct='%1.1f%%', startangle=90, colors=colors)
     ax.set_title('Distribuição de Gravidade')
-    imagens.append(_mpl_fig_to_png_bytes(fig))
+    desenhar_figura(fig)
 
     # 2) Análise por plano (se existir)
     if 'PLANO' in df_res.columns:
-        plano_grav = df_res.groupby(['PLANO', 'GRAVIDADE']).size().unstack(fill_value=0)
-        plano_grav = plano_grav.reindex(columns=['OK', 'INFO', 'ERRO'], fill_value=0)
-        fig, ax = plt.subplots(figsize=(8.5, 4.5))
+        plano_grav = _contagem_plano_gravidade(df_res)
+        fig, ax = _nova_figura(figsize=(8.5, 4.5))
         x = np.arange(len(plano_grav.index))
         w = 0.25
         ax.bar(x - w, plano_grav['OK'].values, width=w, label='OK', color='#28a745')
@@ -1204,67 +1495,48 @@ def gerar_pdf_relatorio_sem_kaleido(titulo, subtitulo, kpis, df_res, df_codigos)
         ax.set_xlabel('Plano')
         ax.set_ylabel('Quantidade')
         ax.legend()
-        imagens.append(_mpl_fig_to_png_bytes(fig))
+        desenhar_figura(fig)
 
     # 3) Top 10 códigos mais utilizados
-    mov_por_codigo = df_res.groupby('CODIGO BENEFICIO').size().reset_index(name='count')
-    mov_por_codigo = mov_por_codigo.merge(
-        df_codigos[['CODIGO', 'DESCRICAO', 'TIPO']],
-        left_on='CODIGO BENEFICIO',
-        right_on='CODIGO',
-        how='left'
-    )
-    top10 = mov_por_codigo.nlargest(10, 'count').sort_values('count', ascending=True)
-    fig, ax = plt.subplots(figsize=(9.0, 5.0))
+    mov_por_codigo = _contagem_por_codigo(df_res, df_codigos, 'count', ('DESCRICAO', 'TIPO'))
+    top10 = mov_por_codigo.nlargest(10, 'count').iloc[::-1]
+    fig, ax = _nova_figura(figsize=(9.0, 5.0))
     ax.barh(top10['DESCRICAO'].fillna(top10['CODIGO BENEFICIO'].astype(str)).astype(str), top10['count'].values, color='#1f77b4')
     ax.set_title('Top 10 Códigos Mais Utilizados')
     ax.set_xlabel('Quantidade')
-    imagens.append(_mpl_fig_to_png_bytes(fig))
+    desenhar_figura(fig)
 
     # 4) Distribuição por tipo
-    tipo_dist = mov_por_codigo.groupby('TIPO')['count'].sum().sort_values(ascending=True)
+    tipo_dist = mov_por_codigo.groupby('TIPO', observed=True)['count'].sum().sort_values(ascending=True)
     if not tipo_dist.empty:
-        fig, ax = plt.subplots(figsize=(7.5, 4.2))
+        fig, ax = _nova_figura(figsize=(7.5, 4.2))
         ax.barh(tipo_dist.index.astype(str), tipo_dist.values, color='#ff7f0e')
         ax.set_title('Distribuição por Tipo de Código')
         ax.set_xlabel('Quantidade')
-        imagens.append(_mpl_fig_to_png_bytes(fig))
+        desenhar_figura(fig)
 
     # 5) Transições (top 15)
-    transicoes = df_res[df_res['MOVIMENTO'] == 'SAIDA'].merge(
-        df_res[df_res['MOVIMENTO'] == 'ENTRADA'],
-        on=['CODIGO ORGANIZACAO NOME', 'ANO MES'],
-        suffixes=('_origem', '_destino')
-    )
-    if not transicoes.empty:
-        trans_grouped = transicoes.groupby(['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().reset_index(name='count')
-        trans_grouped = trans_grouped.nlargest(15, 'count').sort_values('count', ascending=True)
-
-        codigo_to_desc = df_codigos.set_index('CODIGO')['DESCRICAO'].to_dict()
-        labels = trans_grouped.apply(
-            lambda row: f"{int(row['CODIGO BENEFICIO_origem'])}→{int(row['CODIGO BENEFICIO_destino'])}",
-            axis=1
+    contagem_transicoes = calcular_contagem_transicoes(df_res)
+    if not contagem_transicoes.empty:
+        trans_grouped = contagem_transicoes.reset_index(name='count').nlargest(15, 'count').iloc[::-1]
+
+        labels = (
+            trans_grouped['CODIGO BENEFICIO_origem'].astype(int).astype(str) + "→" +
+            trans_grouped['CODIGO BENEFICIO_destino'].astype(int).astype(str)
         )
 
-        fig, ax = plt.subplots(figsize=(9.5, 6.0))
+        fig, ax = _nova_figura(figsize=(9.5, 6.0))
         ax.barh(labels.tolist(), trans_grouped['count'].values, color='#2ca02c')
         ax.set_title('Top 15 Transições Mais Frequentes')
         ax.set_xlabel('Quantidade')
-        imagens.append(_mpl_fig_to_png_bytes(fig))
+        desenhar_figura(fig)
 
         # 6) Heatmap de transições (top 20 códigos para legibilidade)
-        top_codes = pd.concat([
-            transicoes['CODIGO BENEFICIO_origem'],
-            transicoes['CODIGO BENEFICIO_destino']
-        ]).value_counts().head(20).index.tolist()
-
-        matriz = transicoes.groupby(['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().reset_index(name='count')
-        matriz = matriz[matriz['CODIGO BENEFICIO_origem'].isin(top_codes) & matriz['CODIGO BENEFICIO_destino'].isin(top_codes)]
-        if not matriz.empty:
-            pivot = matriz.pivot(index='CODIGO BENEFICIO_origem', columns='CODIGO BENEFICIO_destino', values='count').fillna(0)
-            pivot = pivot.reindex(index=sorted(top_codes), columns=sorted(top_codes), fill_value=0)
-
-            fig, ax = plt.subplots(figsize=(10.0, 7.0))
+        top_codes = _codigos_mais_frequentes(contagem_transicoes)
+
+        pivot = _matriz_transicoes_top(contagem_transicoes, top_codes)
+        if pivot is not None:
+            fig, ax = _nova_figura(figsize=(10.0, 7.0))
             im = ax.imshow(pivot.values, aspect='auto', cmap='RdYlGn')
             ax.set_title('Heatmap de Transições (Top 20 códigos)')
             ax.set_xlabel('Destino')
@@ -1274,51 +1546,36 @@ def gerar_pdf_relatorio_sem_kaleido(titulo, subtitulo, kpis, df_res, df_codigos)
             ax.set_xticklabels([str(int(c)) for c in pivot.columns], rotation=90)
             ax.set_yticklabels([str(int(i)) for i in pivot.index])
             fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
-            imagens.append(_mpl_fig_to_png_bytes(fig))
+            desenhar_figura(fig)
 
     # 7) Erros (se houver)
-    if 'GRAVIDADE' in df_res.columns and (df_res['GRAVIDADE'] == 'ERRO').any():
-        erros_df = df_res[df_res['GRAVIDADE'] == 'ERRO'].copy()
-        erros_df['TIPO_ERRO'] = erros_df['ANALISE'].astype(str).str.extract(r'ERRO: ([^.]+)')[0]
-        tipo_erro_counts = erros_df.groupby('TIPO_ERRO').size().sort_values(ascending=True).tail(10)
+    erros_df = _erros_com_tipo(df_res)
+    if erros_df is not None:
+        tipo_erro_counts = erros_df.groupby('TIPO_ERRO').size().nlargest(10).iloc[::-1]
         if not tipo_erro_counts.empty:
-            fig, ax = plt.subplots(figsize=(9.0, 5.0))
+            fig, ax = _nova_figura(figsize=(9.0, 5.0))
             ax.barh(tipo_erro_counts.index.fillna('Desconhecido').astype(str), tipo_erro_counts.values, color='#dc3545')
             ax.set_title('Top 10 Tipos de Erro')
             ax.set_xlabel('Quantidade')
-            imagens.append(_mpl_fig_to_png_bytes(fig))
+            desenhar_figura(fig)
 
         if 'PLANO' in erros_df.columns:
             erros_plano = erros_df.groupby('PLANO').size()
             if not erros_plano.empty:
-                fig, ax = plt.subplots(figsize=(7.0, 4.2))
+                fig, ax = _nova_figura(figsize=(7.0, 4.2))
                 ax.pie(erros_plano.values, labels=[str(p) for p in erros_plano.index], autopct='%1.1f%%', startangle=90)
                 ax.set_title('Erros por Plano')
-                imagens.append(_mpl_fig_to_png_bytes(fig))
+                desenhar_figura(fig)
 
-        cod_erro = erros_df.groupby('CODIGO BENEFICIO').size().reset_index(name='erros')
-        cod_erro = cod_erro.merge(df_codigos[['CODIGO', 'DESCRICAO']], left_on='CODIGO BENEFICIO', right_on='CODIGO', how='left')
-        cod_erro = cod_erro.sort_values('erros', ascending=False).head(10).sort_values('erros', ascending=True)
+        cod_erro = _contagem_por_codigo(erros_df, df_codigos, 'erros', ('DESCRICAO',))
+        cod_erro = cod_erro.nlargest(10, 'erros').iloc[::-1]
         if not cod_erro.empty:
-            fig, ax = plt.subplots(figsize=(9.0, 5.0))
+            fig, ax = _nova_figura(figsize=(9.0, 5.0))
             labels = cod_erro['DESCRICAO'].fillna(cod_erro['CODIGO BENEFICIO'].astype(str)).astype(str)
             ax.barh(labels, cod_erro['erros'].values, color='crimson')
             ax.set_title('Top 10 Códigos com Mais Erros')
             ax.set_xlabel('Quantidade')
-            imagens.append(_mpl_fig_to_png_bytes(fig))
-
-    # Renderiza imagens no PDF
-    for img_bytes in imagens:
-        img = ImageReader(io.BytesIO(img_bytes))
-        img_w = width - 4 * cm
-        img_h = img_w * (700 / 1200)
-
-        if y - img_h < 2 * cm:
-            c.showPage()
-            y = height - 2 * cm
-
-        c.drawImage(img, 2 * cm, y - img_h, width=img_w, height=img_h, preserveAspectRatio=True, anchor='c')
-        y -= img_h + 1 * cm
+            desenhar_figura(fig)
 
     c.save()
     buffer.seek(0)
@@ -1333,6 +1590,599 @@ def gerar_pdf_relatorio(titulo, subtitulo, kpis, figuras):
 # ============================================================================
 
 
+# Participantes exibidos por página na busca
+MAX_PARTICIPANTES_BUSCA = 50
+
+
+@st.fragment
+def renderizar_estatisticas(df_codigos, regras_validas, constantes):
+    """Aba de estatísticas como fragmento: interações nela reexecutam só este trecho"""
+    st.markdown("## 📈 Estatísticas Detalhadas")
+
+    if 'df_dados' in st.session_state and st.session_state['df_dados'] is not None and not st.session_state['df_dados'].empty:
+        df_base = st.session_state['df_dados']
+        meses_disponiveis_stats = sorted(df_base['ANO MES'].unique())
+        anos_disponiveis = ["Todos"] + sorted({int(m // 100) for m in meses_disponiveis_stats})
+
+        col_filtro_1, col_filtro_2, col_filtro_3 = st.columns([1.2, 1, 1])
+        with col_filtro_1:
+            visao_stats = st.radio(
+                "Tipo de Estatística:",
+                ["Estatística Geral/Anual", "Estatística Mensal"],
+                horizontal=False
+            )
+
+        mes_alvo = None
+        with col_filtro_2:
+            ano_sel = st.selectbox("Ano:", anos_disponiveis, index=len(anos_disponiveis) - 1)
+        with col_filtro_3:
+            if ano_sel == "Todos":
+                meses_do_ano = sorted({int(m % 100) for m in meses_disponiveis_stats})
+            else:
+                meses_do_ano = sorted({int(m % 100) for m in meses_disponiveis_stats if int(m // 100) == int(ano_sel)})
+            if not meses_do_ano:
+                meses_do_ano = [1]
+            mes_sel = st.selectbox("Mês:", meses_do_ano, index=len(meses_do_ano) - 1)
+            if ano_sel == "Todos":
+                mes_alvo = meses_disponiveis_stats[-1]
+            else:
+                mes_alvo = int(ano_sel) * 100 + int(mes_sel)
+
+        df_res = None
+        stats = {}
+
+        if visao_stats == "Estatística Mensal":
+            with st.spinner('🔄 Calculando estatísticas mensais...'):
+                df_res, stats = analisar_movimentacoes_mes_cache(
+                    df_base,
+                    df_codigos,
+                    regras_validas,
+                    constantes,
+                    mes_analise=mes_alvo
+                )
+        else:
+            if ano_sel == "Todos":
+                meses_geral = meses_disponiveis_stats
+            else:
+                meses_geral = [m for m in meses_disponiveis_stats if int(m // 100) == int(ano_sel)]
+
+            cache_key = f"geral_{ano_sel}"
+            if 'df_resultado_geral' not in st.session_state:
+                st.session_state['df_resultado_geral'] = {}
+            if 'stats_geral' not in st.session_state:
+                st.session_state['stats_geral'] = {}
+
+            if cache_key not in st.session_state['df_resultado_geral'] or cache_key not in st.session_state['stats_geral']:
+                with st.spinner('🔄 Calculando estatísticas gerais...'):
+                    df_res_geral, stats_geral = analisar_movimentacoes_periodo(
+                        df_base,
+                        df_codigos,
+                        regras_validas,
+                        constantes,
+                        meses=meses_geral
+                    )
+                    st.session_state['df_resultado_geral'][cache_key] = df_res_geral
+                    st.session_state['stats_geral'][cache_key] = stats_geral
+
+            df_res = st.session_state['df_resultado_geral'][cache_key]
+            stats = st.session_state['stats_geral'].get(cache_key, {})
+
+        if df_res is None or df_res.empty:
+            st.info("ℹ️ Não há dados para exibir com os filtros selecionados")
+            return
+
+        figuras_pdf = []
+
+        # ============================================================================
+        # SEÇÃO 1: VISÃO GERAL COM KPIS
+        # ============================================================================
+        st.markdown("### 🎯 Indicadores Chave de Performance (KPIs)")
+
+        col1, col2, col3, col4, col5 = st.columns(5)
+
+        # KPIs e contagens base/de transições (cacheados); gráficos abaixo só re-somam estes resultados
+        kpis, contagem_base, total_trans, contagem_transicoes = calcular_agregados_estatisticas(
+            df_res, stats.get('erros', 0))
+        total_movs = kpis['total_movs']
+        total_participantes = kpis['total_participantes']
+        taxa_erro = kpis['taxa_erro']
+        taxa_conformidade = kpis['taxa_conformidade']
+        media_movs_participante = kpis['media_movs_participante']
+
+        with col1:
+            st.metric("👥 Participantes", f"{total_participantes:,}",
+                      help="Total de participantes únicos analisados")
+        with col2:
+            st.metric(
+                "📋 Movimentações", f"{total_movs:,}", help="Total de registros de movimentação")
+        with col3:
+            st.metric("✅ Taxa Conformidade", f"{taxa_conformidade:.1f}%",
+                      delta=f"{taxa_conformidade - 85:.1f}%" if taxa_conformidade >= 85 else None,
+                      help="Percentual de participantes sem erros")
+        with col4:
+            st.metric("⚠️ Taxa de Erro", f"{taxa_erro:.1f}%",
+                      delta=f"{taxa_erro - 15:.1f}%" if taxa_erro > 0 else "0%",
+                      delta_color="inverse",
+                      help="Percentual de participantes com erros críticos")
+        with col5:
+            st.metric("📊 Média Movs/Pessoa", f"{media_movs_participante:.1f}",
+                      help="Número médio de movimentações por participante")
+        st.markdown("---")
+
+        # ============================================================================
+        # SEÇÃO 2: ANÁLISE TEMPORAL E TENDÊNCIAS
+        # ============================================================================
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("### 📅 Distribuição de Gravidade")
+
+            # Gráfico de rosca com percentuais
+            gravidade_counts = contagem_base.groupby(
+                level='GRAVIDADE', observed=True).sum().reset_index(name='count')
+            gravidade_counts['percentual'] = (
+                gravidade_counts['count'] / gravidade_counts['count'].sum() * 100).round(1)
+
+            colors_gravidade = {'OK': '#28a745',
+                                'INFO': '#17a2b8', 'ERRO': '#dc3545'}
+
+            fig = go.Figure(data=[go.Pie(
+                labels=gravidade_counts['GRAVIDADE'],
+                values=gravidade_counts['count'],
+                hole=0.5,
+                marker_colors=[colors_gravidade.get(
+                    g, '#999') for g in gravidade_counts['GRAVIDADE']],
+                textinfo='label+percent',
+                textposition='outside',
+                hovertemplate='<b>%{label}</b><br>Quantidade: %{value}<br>Percentual: %{percent}<extra></extra>'
+            )])
+
+            fig.update_layout(
+                title="Classificação das Análises",
+                height=400,
+                showlegend=True,
+                annotations=[dict(
+                    text=f'{total_participantes}<br>Participantes', x=0.5, y=0.5, font_size=16, showarrow=False)]
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            figuras_pdf.append(fig)
+
+        with col2:
+            st.markdown("### 🏢 Análise por Plano")
+
+            if 'PLANO' in df_res.columns:
+                plano_gravidade = contagem_base.groupby(
+                    level=['PLANO', 'GRAVIDADE'], observed=True).sum().reset_index(name='count')
+
+                fig = px.bar(
+                    plano_gravidade,
+                    x='PLANO',
+                    y='count',
+                    color='GRAVIDADE',
+                    title="Movimentações por Plano e Status",
+                    color_discrete_map=colors_gravidade,
+                    barmode='group',
+                    text='count'
+                )
+
+                fig.update_traces(textposition='outside')
+                fig.update_layout(
+                    xaxis_title="Plano",
+                    yaxis_title="Quantidade",
+                    height=400,
+                    hovermode='x unified'
+                )
+                st.plotly_chart(fig, use_container_width=True)
+                figuras_pdf.append(fig)
+            else:
+                st.info("ℹ️ Coluna PLANO não disponível nos dados")
+
+        st.markdown("---")
+
+        # ============================================================================
+        # SEÇÃO 3: ANÁLISE DE CÓDIGOS E BENEFÍCIOS
+        # ============================================================================
+        st.markdown("### 💼 Análise de Códigos de Benefício")
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("#### 📊 Top 10 Códigos Mais Utilizados")
+
+            mov_por_codigo = contagem_base.groupby(
+                level='CODIGO BENEFICIO').sum().reset_index(name='count')
+            mov_por_codigo = mov_por_codigo.merge(
+                df_codigos[['CODIGO', 'DESCRICAO', 'TIPO']],
+                left_on='CODIGO BENEFICIO',
+                right_on='CODIGO'
+            )
+            mov_por_codigo['percentual'] = (
+                mov_por_codigo['count'] / mov_por_codigo['count'].sum() * 100).round(2)
+
+            top10 = mov_por_codigo.nlargest(10, 'count')
+
+            fig = go.Figure(data=[go.Bar(
+                x=top10['count'],
+                y=top10['DESCRICAO'],
+                orientation='h',
+                text=top10['count'],
+                textposition='auto',
+                marker=dict(
+                    color=top10['count'],
+                    colorscale='Blues',
+                    showscale=True,
+                    colorbar=dict(title="Quantidade")
+                ),
+                hovertemplate='<b>%{y}</b><br>Código: ' + top10['CODIGO'].astype(
+                    str) + '<br>Quantidade: %{x}<br>Percentual: ' + top10['percentual'].astype(str) + '%<extra></extra>'
+            )])
+
+            fig.update_layout(
+                title="Códigos com Maior Volume",
+                xaxis_title="Quantidade de Movimentações",
+                yaxis_title="",
+                height=450,
+                yaxis=dict(autorange="reversed")
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            figuras_pdf.append(fig)
+
+        with col2:
+            st.markdown("#### 🎭 Distribuição por Tipo de Código")
+
+            tipo_dist = mov_por_codigo.groupby(
+                'TIPO', observed=True)['count'].sum().reset_index()
+            tipo_dist = tipo_dist.sort_values('count', ascending=False)
+
+            colors_tipo = {'Benefício': '#ff7f0e', 'Instituto': '#2ca02c',
+                           'População': '#1f77b4', 'Consolidador': '#d62728'}
+
+            fig = go.Figure(data=[go.Bar(
+                x=tipo_dist['TIPO'],
+                y=tipo_dist['count'],
+                text=tipo_dist['count'],
+                textposition='auto',
+                marker_color=[colors_tipo.get(t, '#999')
+                              for t in tipo_dist['TIPO']],
+                hovertemplate='<b>%{x}</b><br>Quantidade: %{y}<extra></extra>'
+            )])
+
+            fig.update_layout(
+                title="Volume por Categoria",
+                xaxis_title="Tipo de Código",
+                yaxis_title="Quantidade",
+                height=450,
+                showlegend=False
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            figuras_pdf.append(fig)
+
+        # Tabela detalhada
+        with st.expander("📋 Ver Tabela Completa de Códigos"):
+            st.dataframe(
+                mov_por_codigo[['CODIGO', 'DESCRICAO',
+                                'TIPO', 'count', 'percentual']]
+                .sort_values('count', ascending=False)
+                .rename(columns={'count': 'Quantidade', 'percentual': 'Percentual (%)', 'CODIGO': 'Código', 'DESCRICAO': 'Descrição'}),
+                use_container_width=True,
+                height=400
+            )
+
+        st.markdown("---")
+
+        # ============================================================================
+        # SEÇÃO 4: ANÁLISE DE TRANSIÇÕES (GRÁFICO DE BARRAS AGRUPADAS)
+        # ============================================================================
+        st.markdown("### 🔄 Análise de Transições")
+
+        if total_trans > 0:
+            col1, col2 = st.columns([2, 1])
+
+            with col1:
+                st.markdown("#### 📊 Top 15 Transições Mais Frequentes")
+
+                # Prepara dados para o gráfico
+                trans_grouped = contagem_transicoes.reset_index(name='count')
+                trans_grouped = trans_grouped.nlargest(15, 'count')
+
+                # Mapeia códigos para nomes (dicionário pré-montado na base de conhecimento)
+                codigo_to_desc = constantes['DESC_MAP']
+
+                # Cria labels de transição (operações de coluna, sem apply por linha)
+                cod_origem = trans_grouped['CODIGO BENEFICIO_origem']
+                cod_destino = trans_grouped['CODIGO BENEFICIO_destino']
+                desc_origem = cod_origem.map(codigo_to_desc)
+                desc_destino = cod_destino.map(codigo_to_desc)
+                trans_grouped['transicao'] = (
+                    desc_origem.fillna(cod_origem.astype(str)).str.slice(0, 20) + "\n→\n" +
+                    desc_destino.fillna(cod_destino.astype(str)).str.slice(0, 20)
+                )
+
+                trans_grouped['transicao_hover'] = (
+                    cod_origem.astype(str) + " → " + cod_destino.astype(str) + "<br>" +
+                    desc_origem.fillna('Desconhecido') + "<br>para<br>" + desc_destino.fillna('Desconhecido')
+                )
+
+                # Cria gráfico de barras horizontais
+                fig = go.Figure(data=[go.Bar(
+                    y=trans_grouped['transicao'],
+                    x=trans_grouped['count'],
+                    orientation='h',
+                    text=trans_grouped['count'],
+                    textposition='auto',
+                    marker=dict(
+                        color=trans_grouped['count'],
+                        colorscale='Viridis',
+                        showscale=True,
+                        colorbar=dict(title="Quantidade")
+                    ),
+                    hovertemplate='<b>%{customdata}</b><br>Quantidade: %{x}<extra></extra>',
+                    customdata=trans_grouped['transicao_hover']
+                )])
+
+                fig.update_layout(
+                    title="Fluxos de Transição (Origem → Destino)",
+                    xaxis_title="Quantidade de Participantes",
+                    yaxis_title="",
+                    height=600,
+                    yaxis=dict(autorange="reversed"),
+                    font=dict(size=10)
+                )
+                st.plotly_chart(fig, use_container_width=True)
+                figuras_pdf.append(fig)
+
+            with col2:
+                st.markdown("#### 📈 Estatísticas de Transições")
+
+                trans_unicas = contagem_transicoes.shape[0]
+                trans_mais_comum = contagem_transicoes.idxmax()
+                trans_mais_comum_count = contagem_transicoes.max()
+
+                st.metric("🔀 Total de Transições", f"{total_trans:,}")
+                st.metric("🎯 Tipos Únicos", f"{trans_unicas}")
+
+                st.markdown("**🏆 Transição Mais Comum:**")
+                origem_desc = get_descricao(
+                    trans_mais_comum[0], df_codigos)
+                destino_desc = get_descricao(
+                    trans_mais_comum[1], df_codigos)
+                st.info(
+                    f"{origem_desc[:25]}...\n\n↓\n\n{destino_desc[:25]}...\n\n**{trans_mais_comum_count} casos**")
+
+                # Top 5 transições
+                st.markdown("**📊 Top 5 Transições:**")
+                top5_trans = contagem_transicoes.nlargest(5)
+
+                # Pares e contagens lidos direto do índice/valores (sem iterrows)
+                for idx, ((cod_origem, cod_destino), n_trans) in enumerate(
+                        zip(top5_trans.index.tolist(), top5_trans.tolist())):
+                    origem = get_descricao(cod_origem, df_codigos)
+                    destino = get_descricao(cod_destino, df_codigos)
+                    st.markdown(
+                        f"{idx+1}. `{cod_origem}→{cod_destino}` ({n_trans}x)")
+                    st.caption(f"   {origem[:20]}... → {destino[:20]}...")
+
+            # Heatmap de transições
+            st.markdown("#### 🔥 Matriz de Calor - Transições")
+
+            # Matriz inteira direto das contagens (sem reset_index/pivot e sem preenchimento em float64)
+            matriz_pivot = contagem_transicoes.unstack(fill_value=0).astype(np.int32)
+
+            # Adiciona labels
+            desc_map = constantes['DESC_MAP']
+            origem_labels = [
+                f"{cod}<br>{desc_map.get(cod, f'Código Desconhecido ({cod})')[:15]}" for cod in matriz_pivot.index.astype(int)]
+            destino_labels = [
+                f"{cod}<br>{desc_map.get(cod, f'Código Desconhecido ({cod})')[:15]}" for cod in matriz_pivot.columns.astype(int)]
+
+            # Rótulos das células formatados de uma vez no NumPy; zeros ficam em branco
+            # (menos texto para o plotly serializar e desenhar em matrizes largas)
+            matriz_valores = matriz_pivot.to_numpy()
+            matriz_texto = np.where(matriz_valores > 0, matriz_valores.astype(str), '')
+
+            fig = go.Figure(data=go.Heatmap(
+                z=matriz_valores,
+                x=destino_labels,
+                y=origem_labels,
+                colorscale='RdYlGn',
+                text=matriz_texto,
+                texttemplate='%{text}',
+                textfont={"size": 10},
+                hovertemplate='Origem: %{y}<br>Destino: %{x}<br>Quantidade: %{z}<extra></extra>',
+                colorbar=dict(title="Qtd")
+            ))
+
+            fig.update_layout(
+                title="Mapa de Calor das Transições (Origem vs Destino)",
+                xaxis_title="Código Destino",
+                yaxis_title="Código Origem",
+                height=600,
+                xaxis={'side': 'bottom'},
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            figuras_pdf.append(fig)
+
+        st.markdown("---")
+
+        # ============================================================================
+        # SEÇÃO 5: ANÁLISE DE ERROS
+        # ============================================================================
+        if stats.get('erros', 0) > 0:
+            st.markdown("### ⚠️ Análise Detalhada de Erros")
+
+            # Tipo de erro extraído da mensagem uma única vez
+            erros_df = _erros_com_tipo(df_res)
+
+            col1, col2 = st.columns(2)
+
+            with col1:
+                st.markdown("#### 🎯 Tipos de Erro Mais Comuns")
+
+                tipo_erro_counts = erros_df.groupby('TIPO_ERRO').size().reset_index(
+                    name='count').sort_values('count', ascending=False)
+
+                fig = px.bar(
+                    tipo_erro_counts.head(10),
+                    y='TIPO_ERRO',
+                    x='count',
+                    orientation='h',
+                    title="Top 10 Tipos de Erro",
+                    color='count',
+                    color_continuous_scale='Reds',
+                    text='count'
+                )
+                fig.update_traces(textposition='outside')
+                fig.update_layout(height=400, yaxis={
+                                  'categoryorder': 'total ascending'})
+                st.plotly_chart(fig, use_container_width=True)
+                figuras_pdf.append(fig)
+
+            with col2:
+                st.markdown("#### 🏢 Erros por Plano")
+
+                if 'PLANO' in erros_df.columns:
+                    erros_plano = erros_df.groupby(
+                        'PLANO').size().reset_index(name='count')
+
+                    fig = go.Figure(data=[go.Pie(
+                        labels=erros_plano['PLANO'],
+                        values=erros_plano['count'],
+                        hole=0.4,
+                        marker_colors=px.colors.sequential.Reds[2:],
+                        textinfo='label+value+percent'
+                    )])
+
+                    fig.update_layout(
+                        title="Distribuição de Erros por Plano",
+                        height=400
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+                    figuras_pdf.append(fig)
+                else:
+                    st.info("ℹ️ Coluna PLANO não disponível")
+
+            # Ranking de códigos com erro
+            st.markdown("#### 🚨 Códigos Mais Problemáticos")
+
+            # Descrição via map; códigos fora da base ficam de fora, como na junção interna
+            cod_erro = _contagem_por_codigo(erros_df, df_codigos, 'erros', ('DESCRICAO',))
+            cod_erro = cod_erro[cod_erro['DESCRICAO'].notna()]
+            cod_erro = cod_erro.sort_values(
+                'erros', ascending=False).head(10)
+
+            fig = go.Figure(data=[go.Bar(
+                x=cod_erro['DESCRICAO'],
+                y=cod_erro['erros'],
+                text=cod_erro['erros'],
+                textposition='auto',
+                marker_color='crimson'
+            )])
+
+            fig.update_layout(
+                title="Top 10 Códigos com Mais Erros",
+                xaxis_title="Código",
+                yaxis_title="Quantidade de Erros",
+                height=400,
+                xaxis_tickangle=-45
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            figuras_pdf.append(fig)
+
+        st.markdown("---")
+
+        # ==========================================================================
+        # SEÇÃO 6: INSIGHTS E RECOMENDAÇÕES
+        # ==========================================================================
+        st.markdown("### 💡 Insights e Recomendações")
+
+        # Limites comparados em inteiros (contagens cruzadas), sem divisão em ponto flutuante;
+        # as taxas em float ficam só para exibição
+        info_n = stats.get('info', 0)
+        total_n = stats.get('total', 1)
+        erros_n = stats.get('erros', 0)
+
+        # (título da coluna, [(nível, mensagem, condição)]): cada limite é avaliado uma única vez
+        insights = (
+            ("#### ✅ Pontos Fortes", [
+                ('success', "✓ Excelente taxa de conformidade", erros_n * 10 <= total_participantes),
+                ('success', "✓ Processos estão sendo concluídos rapidamente", total_movs < 5 * total_participantes),
+                ('success', "✓ Poucos processos pendentes", info_n * 10 < total_n * 3),
+            ]),
+            ("#### ⚠️ Pontos de Atenção", [
+                ('warning', f"⚠ Taxa de erro acima de 10% ({taxa_erro:.1f}%)", erros_n * 10 > total_participantes),
+                ('warning', f"⚠ Muitos processos em andamento ({info_n})", info_n * 10 > total_n * 3),
+                ('warning', "⚠ Muitas movimentações por participante", total_movs > 6 * total_participantes),
+            ]),
+            ("#### 🎯 Próximos Passos", [
+                ('info', "→ Revisar casos com erro crítico", erros_n * 20 > total_participantes),
+                ('info', f"→ Acompanhar {info_n} processos pendentes", info_n > 20),
+                ('info', "→ Monitorar tendências mensais", True),
+            ]),
+        )
+
+        for coluna, (titulo, alertas) in zip(st.columns(3), insights):
+            with coluna:
+                st.markdown(titulo)
+                for nivel, mensagem, ativo in alertas:
+                    if ativo:
+                        getattr(st, nivel)(mensagem)
+
+        st.markdown("### 📄 Exportação")
+        col_pdf_1, col_pdf_2 = st.columns([1, 2])
+        with col_pdf_1:
+            gerar_pdf = st.button(
+                "📄 Gerar PDF",
+                type="secondary",
+                use_container_width=True,
+                key=f"gerar_pdf_{visao_stats}_{ano_sel}_{mes_alvo}"
+            )
+
+        if gerar_pdf:
+            try:
+                titulo = "Relatório de Estatísticas - ArcelorMittal"
+                if visao_stats == "Estatística Mensal":
+                    subtitulo = f"Período: {mes_alvo}"
+                else:
+                    if ano_sel == "Todos":
+                        subtitulo = f"Período: {meses_disponiveis_stats[0]} a {meses_disponiveis_stats[-1]}"
+                    else:
+                        subtitulo = f"Ano: {ano_sel}"
+
+                kpis_pdf = {
+                    'Participantes': f"{total_participantes:,}",
+                    'Movimentações': f"{total_movs:,}",
+                    'Taxa Conformidade': f"{taxa_conformidade:.1f}%",
+                    'Taxa de Erro': f"{taxa_erro:.1f}%",
+                    'Média Movs/Pessoa': f"{media_movs_participante:.1f}"
+                }
+
+                st.session_state['pdf_bytes'] = gerar_pdf_relatorio_visual(
+                    titulo,
+                    subtitulo,
+                    kpis_pdf,
+                    df_res,
+                    df_codigos
+                )
+                st.success("✅ PDF gerado")
+            except Exception as e:
+                st.error(f"❌ Não foi possível gerar o PDF: {e}")
+
+        with col_pdf_2:
+            if 'pdf_bytes' in st.session_state and st.session_state['pdf_bytes']:
+                sufixo = mes_alvo if visao_stats == 'Estatística Mensal' else (ano_sel if ano_sel != 'Todos' else 'geral')
+                nome_pdf = f"relatorio_estatisticas_{sufixo}.pdf"
+                st.download_button(
+                    label="📥 Download PDF",
+                    data=st.session_state['pdf_bytes'],
+                    file_name=nome_pdf,
+                    mime="application/pdf",
+                    use_container_width=True
+                )
+
+    else:
+        st.info("ℹ️ Carregue um arquivo e/ou execute uma análise primeiro")
+
+
 def main():
     st.markdown('<div class="main-header">📊 Sistema de Análise de Movimentações Previdenciárias<br>ArcelorMittal</div>', unsafe_allow_html=True)
 
@@ -1382,11 +2232,16 @@ def main():
             if uploaded_file is not None:
                 try:
                     with st.spinner('🔄 Processando arquivo...'):
+                        # Leitores colunares: calamine (Rust) para Excel e pyarrow (multithread) para CSV
                         if uploaded_file.name.endswith('.xlsx'):
-                            df_bruto = pd.read_excel(uploaded_file)
+                            try:
+                                df_bruto = pd.read_excel(uploaded_file, engine='calamine')
+                            except ImportError:
+                                uploaded_file.seek(0)
+                                df_bruto = pd.read_excel(uploaded_file)
                         else:
                             df_bruto = pd.read_csv(
-                                uploaded_file, sep=';', on_bad_lines='skip')
+                                uploaded_file, sep=';', on_bad_lines='skip', engine='pyarrow')
 
                         # Limpeza e preparação
                         df_bruto.columns = df_bruto.columns.str.strip()
@@ -1400,8 +2255,7 @@ def main():
                             'MOVIMENTO': 'MOVIMENTO'
                         }
 
-                        df_bruto.rename(columns=column_mapping, inplace=True)
-                        df_para_analise = df_bruto.copy()
+                        df_para_analise = df_bruto.rename(columns=column_mapping)
 
                         # Conversões
                         df_para_analise['CODIGO BENEFICIO'] = pd.to_numeric(
@@ -1421,21 +2275,22 @@ def main():
 
                         # Remove códigos ignorados
                         # df_para_analise = df_para_analise[~df_para_analise['CODIGO BENEFICIO'].isin(
-                        #     constantes['CODIGOS_IGNORAR'])].copy()
+                        #     constantes['CODIGOS_IGNORAR'])]
 
-                        # Remove duplicatas
-                        df_para_analise = df_para_analise.sort_values('ANO MES').drop_duplicates(
-                            subset=['CODIGO_ORG', 'NOME',
-                                    'CODIGO BENEFICIO', 'MOVIMENTO'],
-                            keep='first'
-                        )
+                        # Remove duplicatas mantendo o mês mais antigo de cada lançamento
+                        # (agregação por hash, sem ordenar o arquivo inteiro; preserva a ordem original)
+                        idx_primeiro = df_para_analise.groupby(
+                            ['CODIGO_ORG', 'NOME', 'CODIGO BENEFICIO', 'MOVIMENTO'],
+                            sort=False, dropna=False
+                        )['ANO MES'].idxmin()
+                        df_para_analise = df_para_analise.loc[np.sort(idx_primeiro.to_numpy())]
 
                         # Cria identificador
                         df_para_analise['CODIGO ORGANIZACAO NOME'] = (
                             df_para_analise['CODIGO_ORG'].astype(str) + " - " +
-                            df_para_analise['NOME'].apply(
-                                formatar_nome_participante)
+                            formatar_nomes(df_para_analise['NOME'])
                         )
+                        df_para_analise = otimizar_tipos(df_para_analise)
 
                         st.success(
                             f"✅ Arquivo carregado: {len(df_para_analise)} registros válidos")
@@ -1461,45 +2316,28 @@ def main():
 
             if st.button("🎲 Gerar Dados de Teste", type="primary"):
                 with st.spinner('🔄 Gerando dados...'):
-                    # Importa gerador (simplificado aqui)
-                    from datetime import datetime
-                    import random
-
-                    random.seed(42)
-                    dados = []
-
-                    for i in range(n_participantes):
-                        codigo_org = 50000000 + i
-                        nome = f"Participante Teste {i+1}"
-                        plano = random.choice([3, 4, 5, 6, 7])
-
-                        # Transição simples
-                        origem = random.choice([31100, 31200])
-                        destino = random.choice([11100, 21000, 22000])
-
-                        dados.append({
-                            'CODIGO_ORG': codigo_org,
-                            'NOME': nome,
-                            'PLANO': plano,
-                            'ANO MES': mes_teste,
-                            'CODIGO BENEFICIO': origem,
-                            'MOVIMENTO': 'SAIDA'
-                        })
-
-                        dados.append({
-                            'CODIGO_ORG': codigo_org,
-                            'NOME': nome,
-                            'PLANO': plano,
-                            'ANO MES': mes_teste,
-                            'CODIGO BENEFICIO': destino,
-                            'MOVIMENTO': 'ENTRADA'
-                        })
-
-                    df_para_analise = pd.DataFrame(dados)
+                    # Colunas amostradas de uma vez; cada participante gera uma SAIDA seguida de uma ENTRADA
+                    rng = np.random.default_rng(42)
+                    ids = np.arange(n_participantes)
+                    plano = rng.choice([3, 4, 5, 6, 7], n_participantes)
+
+                    # Transição simples
+                    origem = rng.choice([31100, 31200], n_participantes)
+                    destino = rng.choice([11100, 21000, 22000], n_participantes)
+
+                    df_para_analise = pd.DataFrame({
+                        'CODIGO_ORG': np.repeat(50000000 + ids, 2),
+                        'NOME': np.repeat([f"Participante Teste {i + 1}" for i in ids], 2),
+                        'PLANO': np.repeat(plano, 2),
+                        'ANO MES': mes_teste,
+                        'CODIGO BENEFICIO': np.column_stack([origem, destino]).ravel(),
+                        'MOVIMENTO': np.tile(['SAIDA', 'ENTRADA'], n_participantes)
+                    })
                     df_para_analise['CODIGO ORGANIZACAO NOME'] = (
                         df_para_analise['CODIGO_ORG'].astype(
                             str) + " - " + df_para_analise['NOME']
                     )
+                    df_para_analise = otimizar_tipos(df_para_analise)
 
                     st.success(
                         f"✅ {len(df_para_analise)} registros de teste gerados")
@@ -1536,7 +2374,7 @@ def main():
                 with st.spinner('🔄 Analisando movimentações...'):
                     if len(meses_selecionados) == 1:
                         # Análise de um único mês
-                        df_resultado, stats = analisar_movimentacoes_mes(
+                        df_resultado, stats = analisar_movimentacoes_mes_cache(
                             df_para_analise,
                             df_codigos,
                             regras_validas,
@@ -1639,598 +2477,7 @@ def main():
                         )
 
     with tab2:
-        st.markdown("## 📈 Estatísticas Detalhadas")
-
-        if 'df_dados' in st.session_state and st.session_state['df_dados'] is not None and not st.session_state['df_dados'].empty:
-            df_base = st.session_state['df_dados']
-            meses_disponiveis_stats = sorted(df_base['ANO MES'].unique())
-            anos_disponiveis = ["Todos"] + sorted({int(m // 100) for m in meses_disponiveis_stats})
-
-            col_filtro_1, col_filtro_2, col_filtro_3 = st.columns([1.2, 1, 1])
-            with col_filtro_1:
-                visao_stats = st.radio(
-                    "Tipo de Estatística:",
-                    ["Estatística Geral/Anual", "Estatística Mensal"],
-                    horizontal=False
-                )
-
-            mes_alvo = None
-            with col_filtro_2:
-                ano_sel = st.selectbox("Ano:", anos_disponiveis, index=len(anos_disponiveis) - 1)
-            with col_filtro_3:
-                if ano_sel == "Todos":
-                    meses_do_ano = sorted({int(m % 100) for m in meses_disponiveis_stats})
-                else:
-                    meses_do_ano = sorted({int(m % 100) for m in meses_disponiveis_stats if int(m // 100) == int(ano_sel)})
-                if not meses_do_ano:
-                    meses_do_ano = [1]
-                mes_sel = st.selectbox("Mês:", meses_do_ano, index=len(meses_do_ano) - 1)
-                if ano_sel == "Todos":
-                    mes_alvo = meses_disponiveis_stats[-1]
-                else:
-                    mes_alvo = int(ano_sel) * 100 + int(mes_sel)
-
-            df_res = None
-            stats = {}
-
-            if visao_stats == "Estatística Mensal":
-                with st.spinner('🔄 Calculando estatísticas mensais...'):
-                    df_res, stats = analisar_movimentacoes_mes(
-                        df_base,
-                        df_codigos,
-                        regras_validas,
-                        constantes,
-                        mes_analise=mes_alvo
-                    )
-            else:
-                if ano_sel == "Todos":
-                    meses_geral = meses_disponiveis_stats
-                else:
-                    meses_geral = [m for m in meses_disponiveis_stats if int(m // 100) == int(ano_sel)]
-
-                cache_key = f"geral_{ano_sel}"
-                if 'df_resultado_geral' not in st.session_state:
-                    st.session_state['df_resultado_geral'] = {}
-                if 'stats_geral' not in st.session_state:
-                    st.session_state['stats_geral'] = {}
-
-                if cache_key not in st.session_state['df_resultado_geral'] or cache_key not in st.session_state['stats_geral']:
-                    with st.spinner('🔄 Calculando estatísticas gerais...'):
-                        df_res_geral, stats_geral = analisar_movimentacoes_periodo(
-                            df_base,
-                            df_codigos,
-                            regras_validas,
-                            constantes,
-                            meses=meses_geral
-                        )
-                        st.session_state['df_resultado_geral'][cache_key] = df_res_geral
-                        st.session_state['stats_geral'][cache_key] = stats_geral
-
-                df_res = st.session_state['df_resultado_geral'][cache_key]
-                stats = st.session_state['stats_geral'].get(cache_key, {})
-
-            if df_res is None or df_res.empty:
-                st.info("ℹ️ Não há dados para exibir com os filtros selecionados")
-                st.stop()
-
-            figuras_pdf = []
-
-            # ============================================================================
-            # SEÇÃO 1: VISÃO GERAL COM KPIS
-            # ============================================================================
-            st.markdown("### 🎯 Indicadores Chave de Performance (KPIs)")
-
-            col1, col2, col3, col4, col5 = st.columns(5)
-
-            total_movs = len(df_res)
-            total_participantes = df_res['CODIGO ORGANIZACAO NOME'].nunique()
-            taxa_erro = (stats.get('erros', 0) / total_participantes *
-                         100) if total_participantes > 0 else 0
-            taxa_conformidade = 100 - taxa_erro
-            media_movs_participante = total_movs / \
-                total_participantes if total_participantes > 0 else 0
-
-            with col1:
-                st.metric("👥 Participantes", f"{total_participantes:,}",
-                          help="Total de participantes únicos analisados")
-            with col2:
-                st.metric(
-                    "📋 Movimentações", f"{total_movs:,}", help="Total de registros de movimentação")
-            with col3:
-                st.metric("✅ Taxa Conformidade", f"{taxa_conformidade:.1f}%",
-                          delta=f"{taxa_conformidade - 85:.1f}%" if taxa_conformidade >= 85 else None,
-                          help="Percentual de participantes sem erros")
-            with col4:
-                st.metric("⚠️ Taxa de Erro", f"{taxa_erro:.1f}%",
-                          delta=f"{taxa_erro - 15:.1f}%" if taxa_erro > 0 else "0%",
-                          delta_color="inverse",
-                          help="Percentual de participantes com erros críticos")
-            with col5:
-                st.metric("📊 Média Movs/Pessoa", f"{media_movs_participante:.1f}",
-                          help="Número médio de movimentações por participante")
-            st.markdown("---")
-
-            # ============================================================================
-            # SEÇÃO 2: ANÁLISE TEMPORAL E TENDÊNCIAS
-            # ============================================================================
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.markdown("### 📅 Distribuição de Gravidade")
-
-                # Gráfico de rosca com percentuais
-                gravidade_counts = df_res.groupby(
-                    'GRAVIDADE').size().reset_index(name='count')
-                gravidade_counts['percentual'] = (
-                    gravidade_counts['count'] / gravidade_counts['count'].sum() * 100).round(1)
-
-                colors_gravidade = {'OK': '#28a745',
-                                    'INFO': '#17a2b8', 'ERRO': '#dc3545'}
-
-                fig = go.Figure(data=[go.Pie(
-                    labels=gravidade_counts['GRAVIDADE'],
-                    values=gravidade_counts['count'],
-                    hole=0.5,
-                    marker_colors=[colors_gravidade.get(
-                        g, '#999') for g in gravidade_counts['GRAVIDADE']],
-                    textinfo='label+percent',
-                    textposition='outside',
-                    hovertemplate='<b>%{label}</b><br>Quantidade: %{value}<br>Percentual: %{percent}<extra></extra>'
-                )])
-
-                fig.update_layout(
-                    title="Classificação das Análises",
-                    height=400,
-                    showlegend=True,
-                    annotations=[dict(
-                        text=f'{total_participantes}<br>Participantes', x=0.5, y=0.5, font_size=16, showarrow=False)]
-                )
-                st.plotly_chart(fig, use_container_width=True)
-                figuras_pdf.append(fig)
-
-            with col2:
-                st.markdown("### 🏢 Análise por Plano")
-
-                if 'PLANO' in df_res.columns:
-                    plano_gravidade = df_res.groupby(
-                        ['PLANO', 'GRAVIDADE']).size().reset_index(name='count')
-
-                    fig = px.bar(
-                        plano_gravidade,
-                        x='PLANO',
-                        y='count',
-                        color='GRAVIDADE',
-                        title="Movimentações por Plano e Status",
-                        color_discrete_map=colors_gravidade,
-                        barmode='group',
-                        text='count'
-                    )
-
-                    fig.update_traces(textposition='outside')
-                    fig.update_layout(
-                        xaxis_title="Plano",
-                        yaxis_title="Quantidade",
-                        height=400,
-                        hovermode='x unified'
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                    figuras_pdf.append(fig)
-                else:
-                    st.info("ℹ️ Coluna PLANO não disponível nos dados")
-
-            st.markdown("---")
-
-            # ============================================================================
-            # SEÇÃO 3: ANÁLISE DE CÓDIGOS E BENEFÍCIOS
-            # ============================================================================
-            st.markdown("### 💼 Análise de Códigos de Benefício")
-
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.markdown("#### 📊 Top 10 Códigos Mais Utilizados")
-
-                mov_por_codigo = df_res.groupby(
-                    'CODIGO BENEFICIO').size().reset_index(name='count')
-                mov_por_codigo = mov_por_codigo.merge(
-                    df_codigos[['CODIGO', 'DESCRICAO', 'TIPO']],
-                    left_on='CODIGO BENEFICIO',
-                    right_on='CODIGO'
-                )
-                mov_por_codigo['percentual'] = (
-                    mov_por_codigo['count'] / mov_por_codigo['count'].sum() * 100).round(2)
-
-                top10 = mov_por_codigo.nlargest(10, 'count')
-
-                fig = go.Figure(data=[go.Bar(
-                    x=top10['count'],
-                    y=top10['DESCRICAO'],
-                    orientation='h',
-                    text=top10['count'],
-                    textposition='auto',
-                    marker=dict(
-                        color=top10['count'],
-                        colorscale='Blues',
-                        showscale=True,
-                        colorbar=dict(title="Quantidade")
-                    ),
-                    hovertemplate='<b>%{y}</b><br>Código: ' + top10['CODIGO'].astype(
-                        str) + '<br>Quantidade: %{x}<br>Percentual: ' + top10['percentual'].astype(str) + '%<extra></extra>'
-                )])
-
-                fig.update_layout(
-                    title="Códigos com Maior Volume",
-                    xaxis_title="Quantidade de Movimentações",
-                    yaxis_title="",
-                    height=450,
-                    yaxis=dict(autorange="reversed")
-                )
-                st.plotly_chart(fig, use_container_width=True)
-                figuras_pdf.append(fig)
-
-            with col2:
-                st.markdown("#### 🎭 Distribuição por Tipo de Código")
-
-                tipo_dist = mov_por_codigo.groupby(
-                    'TIPO')['count'].sum().reset_index()
-                tipo_dist = tipo_dist.sort_values('count', ascending=False)
-
-                colors_tipo = {'Benefício': '#ff7f0e', 'Instituto': '#2ca02c',
-                               'População': '#1f77b4', 'Consolidador': '#d62728'}
-
-                fig = go.Figure(data=[go.Bar(
-                    x=tipo_dist['TIPO'],
-                    y=tipo_dist['count'],
-                    text=tipo_dist['count'],
-                    textposition='auto',
-                    marker_color=[colors_tipo.get(t, '#999')
-                                  for t in tipo_dist['TIPO']],
-                    hovertemplate='<b>%{x}</b><br>Quantidade: %{y}<extra></extra>'
-                )])
-
-                fig.update_layout(
-                    title="Volume por Categoria",
-                    xaxis_title="Tipo de Código",
-                    yaxis_title="Quantidade",
-                    height=450,
-                    showlegend=False
-                )
-                st.plotly_chart(fig, use_container_width=True)
-                figuras_pdf.append(fig)
-
-            # Tabela detalhada
-            with st.expander("📋 Ver Tabela Completa de Códigos"):
-                st.dataframe(
-                    mov_por_codigo[['CODIGO', 'DESCRICAO',
-                                    'TIPO', 'count', 'percentual']]
-                    .sort_values('count', ascending=False)
-                    .rename(columns={'count': 'Quantidade', 'percentual': 'Percentual (%)', 'CODIGO': 'Código', 'DESCRICAO': 'Descrição'}),
-                    use_container_width=True,
-                    height=400
-                )
-
-            st.markdown("---")
-
-            # ============================================================================
-            # SEÇÃO 4: ANÁLISE DE TRANSIÇÕES (GRÁFICO DE BARRAS AGRUPADAS)
-            # ============================================================================
-            st.markdown("### 🔄 Análise de Transições")
-
-            transicoes = df_res[df_res['MOVIMENTO'] == 'SAIDA'].merge(
-                df_res[df_res['MOVIMENTO'] == 'ENTRADA'],
-                on=['CODIGO ORGANIZACAO NOME', 'ANO MES'],
-                suffixes=('_origem', '_destino')
-            )
-
-            if not transicoes.empty:
-                col1, col2 = st.columns([2, 1])
-
-                with col1:
-                    st.markdown("#### 📊 Top 15 Transições Mais Frequentes")
-
-                    # Prepara dados para o gráfico
-                    trans_grouped = transicoes.groupby(
-                        ['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']
-                    ).size().reset_index(name='count')
-                    trans_grouped = trans_grouped.nlargest(15, 'count')
-
-                    # Mapeia códigos para nomes
-                    codigo_to_desc = df_codigos.set_index(
-                        'CODIGO')['DESCRICAO'].to_dict()
-
-                    # Cria labels de transição
-                    trans_grouped['transicao'] = trans_grouped.apply(
-                        lambda row: f"{codigo_to_desc.get(row['CODIGO BENEFICIO_origem'], str(row['CODIGO BENEFICIO_origem']))[:20]}\n→\n{codigo_to_desc.get(row['CODIGO BENEFICIO_destino'], str(row['CODIGO BENEFICIO_destino']))[:20]}",
-                        axis=1
-                    )
-
-                    trans_grouped['transicao_hover'] = trans_grouped.apply(
-                        lambda row: f"{row['CODIGO BENEFICIO_origem']} → {row['CODIGO BENEFICIO_destino']}<br>{codigo_to_desc.get(row['CODIGO BENEFICIO_origem'], 'Desconhecido')}<br>para<br>{codigo_to_desc.get(row['CODIGO BENEFICIO_destino'], 'Desconhecido')}",
-                        axis=1
-                    )
-
-                    # Cria gráfico de barras horizontais
-                    fig = go.Figure(data=[go.Bar(
-                        y=trans_grouped['transicao'],
-                        x=trans_grouped['count'],
-                        orientation='h',
-                        text=trans_grouped['count'],
-                        textposition='auto',
-                        marker=dict(
-                            color=trans_grouped['count'],
-                            colorscale='Viridis',
-                            showscale=True,
-                            colorbar=dict(title="Quantidade")
-                        ),
-                        hovertemplate='<b>%{customdata}</b><br>Quantidade: %{x}<extra></extra>',
-                        customdata=trans_grouped['transicao_hover']
-                    )])
-
-                    fig.update_layout(
-                        title="Fluxos de Transição (Origem → Destino)",
-                        xaxis_title="Quantidade de Participantes",
-                        yaxis_title="",
-                        height=600,
-                        yaxis=dict(autorange="reversed"),
-                        font=dict(size=10)
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                    figuras_pdf.append(fig)
-
-                with col2:
-                    st.markdown("#### 📈 Estatísticas de Transições")
-
-                    total_trans = len(transicoes)
-                    trans_unicas = transicoes.groupby(
-                        ['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().shape[0]
-                    trans_mais_comum = transicoes.groupby(
-                        ['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().idxmax()
-                    trans_mais_comum_count = transicoes.groupby(
-                        ['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().max()
-
-                    st.metric("🔀 Total de Transições", f"{total_trans:,}")
-                    st.metric("🎯 Tipos Únicos", f"{trans_unicas}")
-
-                    st.markdown("**🏆 Transição Mais Comum:**")
-                    origem_desc = get_descricao(
-                        trans_mais_comum[0], df_codigos)
-                    destino_desc = get_descricao(
-                        trans_mais_comum[1], df_codigos)
-                    st.info(
-                        f"{origem_desc[:25]}...\n\n↓\n\n{destino_desc[:25]}...\n\n**{trans_mais_comum_count} casos**")
-
-                    # Top 5 transições
-                    st.markdown("**📊 Top 5 Transições:**")
-                    top5_trans = transicoes.groupby(['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size(
-                    ).nlargest(5).reset_index(name='count')
-
-                    for idx, row in top5_trans.iterrows():
-                        origem = get_descricao(
-                            row['CODIGO BENEFICIO_origem'], df_codigos)
-                        destino = get_descricao(
-                            row['CODIGO BENEFICIO_destino'], df_codigos)
-                        st.markdown(
-                            f"{idx+1}. `{row['CODIGO BENEFICIO_origem']}→{row['CODIGO BENEFICIO_destino']}` ({row['count']}x)")
-                        st.caption(f"   {origem[:20]}... → {destino[:20]}...")
-
-                # Heatmap de transições
-                st.markdown("#### 🔥 Matriz de Calor - Transições")
-
-                matriz = transicoes.groupby(
-                    ['CODIGO BENEFICIO_origem', 'CODIGO BENEFICIO_destino']).size().reset_index(name='count')
-                matriz_pivot = matriz.pivot(
-                    index='CODIGO BENEFICIO_origem', columns='CODIGO BENEFICIO_destino', values='count').fillna(0)
-
-                # Adiciona labels
-                origem_labels = [
-                    f"{int(idx)}<br>{get_descricao(int(idx), df_codigos)[:15]}" for idx in matriz_pivot.index]
-                destino_labels = [
-                    f"{int(col)}<br>{get_descricao(int(col), df_codigos)[:15]}" for col in matriz_pivot.columns]
-
-                fig = go.Figure(data=go.Heatmap(
-                    z=matriz_pivot.values,
-                    x=destino_labels,
-                    y=origem_labels,
-                    colorscale='RdYlGn',
-                    text=matriz_pivot.values,
-                    texttemplate='%{text}',
-                    textfont={"size": 10},
-                    hovertemplate='Origem: %{y}<br>Destino: %{x}<br>Quantidade: %{z}<extra></extra>',
-                    colorbar=dict(title="Qtd")
-                ))
-
-                fig.update_layout(
-                    title="Mapa de Calor das Transições (Origem vs Destino)",
-                    xaxis_title="Código Destino",
-                    yaxis_title="Código Origem",
-                    height=600,
-                    xaxis={'side': 'bottom'},
-                )
-                st.plotly_chart(fig, use_container_width=True)
-                figuras_pdf.append(fig)
-
-            st.markdown("---")
-
-            # ============================================================================
-            # SEÇÃO 5: ANÁLISE DE ERROS
-            # ============================================================================
-            if stats.get('erros', 0) > 0:
-                st.markdown("### ⚠️ Análise Detalhada de Erros")
-
-                erros_df = df_res[df_res['GRAVIDADE'] == 'ERRO'].copy()
-
-                col1, col2 = st.columns(2)
-
-                with col1:
-                    st.markdown("#### 🎯 Tipos de Erro Mais Comuns")
-
-                    # Extrai tipo de erro da mensagem
-                    erros_df['TIPO_ERRO'] = erros_df['ANALISE'].str.extract(
-                        r'ERRO: ([^.]+)')[0]
-                    tipo_erro_counts = erros_df.groupby('TIPO_ERRO').size().reset_index(
-                        name='count').sort_values('count', ascending=False)
-
-                    fig = px.bar(
-                        tipo_erro_counts.head(10),
-                        y='TIPO_ERRO',
-                        x='count',
-                        orientation='h',
-                        title="Top 10 Tipos de Erro",
-                        color='count',
-                        color_continuous_scale='Reds',
-                        text='count'
-                    )
-                    fig.update_traces(textposition='outside')
-                    fig.update_layout(height=400, yaxis={
-                                      'categoryorder': 'total ascending'})
-                    st.plotly_chart(fig, use_container_width=True)
-                    figuras_pdf.append(fig)
-
-                with col2:
-                    st.markdown("#### 🏢 Erros por Plano")
-
-                    if 'PLANO' in erros_df.columns:
-                        erros_plano = erros_df.groupby(
-                            'PLANO').size().reset_index(name='count')
-
-                        fig = go.Figure(data=[go.Pie(
-                            labels=erros_plano['PLANO'],
-                            values=erros_plano['count'],
-                            hole=0.4,
-                            marker_colors=px.colors.sequential.Reds[2:],
-                            textinfo='label+value+percent'
-                        )])
-
-                        fig.update_layout(
-                            title="Distribuição de Erros por Plano",
-                            height=400
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                        figuras_pdf.append(fig)
-                    else:
-                        st.info("ℹ️ Coluna PLANO não disponível")
-
-                # Ranking de códigos com erro
-                st.markdown("#### 🚨 Códigos Mais Problemáticos")
-
-                cod_erro = erros_df.groupby(
-                    'CODIGO BENEFICIO').size().reset_index(name='erros')
-                cod_erro = cod_erro.merge(
-                    df_codigos[['CODIGO', 'DESCRICAO']], left_on='CODIGO BENEFICIO', right_on='CODIGO')
-                cod_erro = cod_erro.sort_values(
-                    'erros', ascending=False).head(10)
-
-                fig = go.Figure(data=[go.Bar(
-                    x=cod_erro['DESCRICAO'],
-                    y=cod_erro['erros'],
-                    text=cod_erro['erros'],
-                    textposition='auto',
-                    marker_color='crimson'
-                )])
-
-                fig.update_layout(
-                    title="Top 10 Códigos com Mais Erros",
-                    xaxis_title="Código",
-                    yaxis_title="Quantidade de Erros",
-                    height=400,
-                    xaxis_tickangle=-45
-                )
-                st.plotly_chart(fig, use_container_width=True)
-                figuras_pdf.append(fig)
-
-            st.markdown("---")
-
-            # ==========================================================================
-            # SEÇÃO 6: INSIGHTS E RECOMENDAÇÕES
-            # ==========================================================================
-            st.markdown("### 💡 Insights e Recomendações")
-
-            col1, col2, col3 = st.columns(3)
-
-            with col1:
-                st.markdown("#### ✅ Pontos Fortes")
-                if taxa_conformidade >= 90:
-                    st.success("✓ Excelente taxa de conformidade")
-                if media_movs_participante < 5:
-                    st.success(
-                        "✓ Processos estão sendo concluídos rapidamente")
-                if stats.get('info', 0) < stats.get('total', 1) * 0.3:
-                    st.success("✓ Poucos processos pendentes")
-
-            with col2:
-                st.markdown("#### ⚠️ Pontos de Atenção")
-                if taxa_erro > 10:
-                    st.warning(
-                        f"⚠ Taxa de erro acima de 10% ({taxa_erro:.1f}%)")
-                if stats.get('info', 0) > stats.get('total', 1) * 0.3:
-                    st.warning(
-                        f"⚠ Muitos processos em andamento ({stats.get('info', 0)})")
-                if media_movs_participante > 6:
-                    st.warning("⚠ Muitas movimentações por participante")
-
-            with col3:
-                st.markdown("#### 🎯 Próximos Passos")
-                if taxa_erro > 5:
-                    st.info("→ Revisar casos com erro crítico")
-                if stats.get('info', 0) > 20:
-                    st.info(
-                        f"→ Acompanhar {stats.get('info', 0)} processos pendentes")
-                st.info("→ Monitorar tendências mensais")
-
-            st.markdown("### 📄 Exportação")
-            col_pdf_1, col_pdf_2 = st.columns([1, 2])
-            with col_pdf_1:
-                gerar_pdf = st.button(
-                    "📄 Gerar PDF",
-                    type="secondary",
-                    use_container_width=True,
-                    key=f"gerar_pdf_{visao_stats}_{ano_sel}_{mes_alvo}"
-                )
-
-            if gerar_pdf:
-                try:
-                    titulo = "Relatório de Estatísticas - ArcelorMittal"
-                    if visao_stats == "Estatística Mensal":
-                        subtitulo = f"Período: {mes_alvo}"
-                    else:
-                        if ano_sel == "Todos":
-                            subtitulo = f"Período: {meses_disponiveis_stats[0]} a {meses_disponiveis_stats[-1]}"
-                        else:
-                            subtitulo = f"Ano: {ano_sel}"
-
-                    kpis_pdf = {
-                        'Participantes': f"{total_participantes:,}",
-                        'Movimentações': f"{total_movs:,}",
-                        'Taxa Conformidade': f"{taxa_conformidade:.1f}%",
-                        'Taxa de Erro': f"{taxa_erro:.1f}%",
-                        'Média Movs/Pessoa': f"{media_movs_participante:.1f}"
-                    }
-
-                    st.session_state['pdf_bytes'] = gerar_pdf_relatorio_visual(
-                        titulo,
-                        subtitulo,
-                        kpis_pdf,
-                        df_res,
-                        df_codigos
-                    )
-                    st.success("✅ PDF gerado")
-                except Exception as e:
-                    st.error(f"❌ Não foi possível gerar o PDF: {e}")
-
-            with col_pdf_2:
-                if 'pdf_bytes' in st.session_state and st.session_state['pdf_bytes']:
-                    sufixo = mes_alvo if visao_stats == 'Estatística Mensal' else (ano_sel if ano_sel != 'Todos' else 'geral')
-                    nome_pdf = f"relatorio_estatisticas_{sufixo}.pdf"
-                    st.download_button(
-                        label="📥 Download PDF",
-                        data=st.session_state['pdf_bytes'],
-                        file_name=nome_pdf,
-                        mime="application/pdf",
-                        use_container_width=True
-                    )
-
-        else:
-            st.info("ℹ️ Carregue um arquivo e/ou execute uma análise primeiro")
+        renderizar_estatisticas(df_codigos, regras_validas, constantes)
 
     with tab3:
         st.markdown("## 🔍 Busca de Participante")
@@ -2238,26 +2485,54 @@ def main():
         if 'df_resultado' in st.session_state:
             df_res = st.session_state['df_resultado']
 
-            nome_busca = st.text_input(
-                "Digite o nome ou código do participante:")
+            # Formulário: a busca só roda ao enviar (Enter ou botão), não a cada tecla
+            with st.form("busca", clear_on_submit=False):
+                termo_digitado = st.text_input(
+                    "Digite o nome ou código do participante:")
+                buscar = st.form_submit_button("🔍 Buscar")
+            if buscar:
+                st.session_state['busca_termo'] = termo_digitado
+                st.session_state['busca_limite'] = MAX_PARTICIPANTES_BUSCA
+            nome_busca = st.session_state.get('busca_termo', '')
 
             if nome_busca:
-                resultados = df_res[df_res['CODIGO ORGANIZACAO NOME'].str.contains(
-                    nome_busca, case=False, na=False)]
+                # Coluna de nomes em minúsculas montada uma vez por resultado e reaproveitada a cada busca
+                indice_busca = st.session_state.get('indice_busca')
+                if indice_busca is None or indice_busca[0] is not df_res:
+                    # A coluna já chega como string[pyarrow] via otimizar_tipos; o astype é no-op nesse caso
+                    nomes_lower = df_res['CODIGO ORGANIZACAO NOME'].astype('string[pyarrow]').str.lower()
+                    indice_busca = (df_res, nomes_lower)
+                    st.session_state['indice_busca'] = indice_busca
+                # Busca literal no kernel Arrow (match_substring); nulos já saem como False
+                mask_busca = indice_busca[1].str.contains(nome_busca.lower(), regex=False, na=False)
+                resultados = df_res[mask_busca.to_numpy(dtype=bool)]
 
                 if not resultados.empty:
                     st.success(
                         f"✅ {len(resultados)} registro(s) encontrado(s)")
 
-                    for participante in resultados['CODIGO ORGANIZACAO NOME'].unique():
+                    # Paginação: só os primeiros participantes viram expanders; "Carregar mais" amplia o limite
+                    limite_busca = st.session_state['busca_limite']
+
+                    # Projeta as colunas exibidas uma vez e particiona numa única passada
+                    colunas_busca = ['PLANO', 'CODIGO BENEFICIO', 'MOVIMENTO', 'GRAVIDADE', 'ANALISE']
+                    resultados_view = resultados[['CODIGO ORGANIZACAO NOME', *colunas_busca]]
+                    grupos_busca = resultados_view.groupby('CODIGO ORGANIZACAO NOME', sort=False)[colunas_busca]
+                    for i, (participante, dados_part) in enumerate(grupos_busca):
+                        if i >= limite_busca:
+                            break
                         with st.expander(f"👤 {participante}"):
-                            dados_part = resultados[resultados['CODIGO ORGANIZACAO NOME']
-                                                    == participante]
                             st.dataframe(
-                                dados_part[['PLANO', 'CODIGO BENEFICIO',
-                                            'MOVIMENTO', 'GRAVIDADE', 'ANALISE']],
+                                dados_part,
                                 use_container_width=True
                             )
+
+                    total_encontrados = grupos_busca.ngroups
+                    if total_encontrados > limite_busca:
+                        st.caption(f"Mostrando {limite_busca} de {total_encontrados} participantes")
+                        if st.button("Carregar mais"):
+                            st.session_state['busca_limite'] = limite_busca + MAX_PARTICIPANTES_BUSCA
+                            st.rerun()
                 else:
                     st.warning("⚠️ Nenhum participante encontrado")
         else:
@@ -2277,7 +2552,7 @@ def main():
         ### 📋 Códigos Principais
         """)
 
-        st.dataframe(df_codigos, use_container_width=True, height=400)
+        st.dataframe(_tabela_codigos_arrow(df_codigos), use_container_width=True, height=400)
 
         st.markdown("""
         ### 🔄 Como Usar